@@ -1,18 +1,57 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from rag_inmemory import InMemoryRAG 
 from werkzeug.utils import secure_filename
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain_openai import OpenAIEmbeddings
-from chunking import extract_chunks_from_file
+from chunking import extract_chunks_from_file, iter_chunks_from_file
+from itertools import islice
+import shutil
 from utils import store_embeddings_with_metadata
 from startup_processor import process_existing_uploads, should_process_uploads
 from file_tracker import clear_processed_files
 from consultation_engine import ConsultationEngine
+import asyncio
+import logging
 import os
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
 
 # Tell Flask where to find the templates and static folders
 app = Flask(__name__)
 
+# The consultation engine shares read-only response templates wrapped in
+# MappingProxyType; neither orjson nor stdlib json serializes the proxy
+# directly, so both providers unwrap it via a default hook
+def _json_default(obj):
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Serialize API responses with orjson (C/SIMD) when available - 3-10x
+# faster than the stdlib json provider on the larger /api responses
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class ORJSONProvider(JSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=_json_default).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = ORJSONProvider(app)
+except ImportError:
+    from flask.json.provider import DefaultJSONProvider
+
+    class _ProxyAwareJSONProvider(DefaultJSONProvider):
+        @staticmethod
+        def default(obj):
+            if isinstance(obj, MappingProxyType):
+                return dict(obj)
+            return DefaultJSONProvider.default(obj)
+
+    app.json = _ProxyAwareJSONProvider(app)
+
 # ... all your existing routes and logic follow here ...
 #app = Flask(__name__)
 
@@ -25,35 +64,30 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Process existing files in uploads folder on startup
-if should_process_uploads():
+# Process existing files in uploads folder on startup. Under the Werkzeug
+# debug reloader the module is imported twice; the parent process (no
+# WERKZEUG_RUN_MAIN) already did the work, so the reloaded child skips it.
+if os.environ.get('WERKZEUG_RUN_MAIN') != 'true' and should_process_uploads():
     print("📄 Processing existing files in uploads folder...")
-    # Pass the existing rag instance instead of creating a new one
-    from process_uploads import scan_uploads_folder, process_file, get_file_category
-    
-    files_to_process = scan_uploads_folder(app.config['UPLOAD_FOLDER'])
-    stats = {"processed": 0, "failed": 0}
-    
-    for file_path, filename in files_to_process:
-        category = get_file_category(filename, {
-            'curriculum': 'Curriculum',
-            'pricing': 'Pricing', 
-            'teacher': 'Teachers',
-            'general': 'General Information',
-        })
-        success = process_file(file_path, filename, category, rag)  # Use existing rag
-        if success:
-            stats["processed"] += 1
-        else:
-            stats["failed"] += 1
-    
+    # Parallel pipeline: PDF extraction runs in worker processes while
+    # the main thread embeds completed files in fixed-size batches.
+    # Passing the existing rag instance keeps the new knowledge in the
+    # matrix this process serves queries from.
+    stats = process_existing_uploads(
+        uploads_path=app.config['UPLOAD_FOLDER'],
+        verbose=False,
+        rag_system=rag,
+    )
     print(f"✅ Startup processing completed: {stats['processed']} files processed")
 else:
     print("ℹ️ No need to process existing files")
 
-ALLOWED_EXTENSIONS = {'pdf', 'txt', 'docx', 'rtf'}
+_ALLOWED_SUFFIXES = ('.pdf', '.txt', '.docx', '.rtf')
+
+# How many chunks to embed per OpenAI request while streaming an upload
+EMBED_BATCH_SIZE = 512
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
 
 @app.route('/')
@@ -72,7 +106,7 @@ def upload_page():
     return render_template('upload.html')
 
 @app.route('/upload', methods=['POST'])
-def upload_file():
+async def upload_file():
     # Validate file input
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
@@ -85,16 +119,29 @@ def upload_file():
     if not category:
         return jsonify({'error': 'Missing category'}), 400
 
-    # Save uploaded file
+    # Save uploaded file (off the event loop - disk I/O blocks). Copy the
+    # stream in 1 MB blocks instead of file.save's 16 KB default, so large
+    # PDFs need ~64x fewer write syscalls
     filename = secure_filename(file.filename)
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
 
-    # Get chunks with chunking.py
-    chunks = extract_chunks_from_file( filepath, filename=filename, category=category, )
+    def save_upload():
+        with open(filepath, 'wb') as dst:
+            shutil.copyfileobj(file.stream, dst, length=1024 * 1024)
 
-    # Store chunks + metadata into in-memory system 
-    store_embeddings_with_metadata(rag, chunks)
+    await asyncio.to_thread(save_upload)
+
+    # Stream chunks out of the file and embed in fixed-size batches so
+    # peak memory stays constant regardless of document size
+    def ingest():
+        chunk_iter = iter_chunks_from_file(filepath, filename=filename, category=category)
+        while True:
+            batch = list(islice(chunk_iter, EMBED_BATCH_SIZE))
+            if not batch:
+                break
+            store_embeddings_with_metadata(rag, batch)
+
+    await asyncio.to_thread(ingest)
 
     return render_template('upload.html', success=True)
 
@@ -105,7 +152,7 @@ def get_categories():
     return jsonify({'categories': categories})
 
 @app.route('/api/chat', methods=['POST'])
-def api_chat():
+async def api_chat():
     try:
         data = request.get_json()
         message = data.get("message")
@@ -117,7 +164,10 @@ def api_chat():
         if not message or not mode or (mode == 'faq' and not category):
             return jsonify({"error": "Message and mode are required. For FAQ mode, category is required."}), 400
 
-        response = rag.generate_agentic_response(
+        # OpenAI embedding/LLM calls block on network - run in a worker thread
+        # so one slow chat doesn't serialize every other request
+        response = await asyncio.to_thread(
+            rag.generate_agentic_response,
             user_input=message,
             category=category,
             mode=mode,
@@ -126,31 +176,48 @@ def api_chat():
 
         return jsonify({"response": response})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("chat request failed")
         return jsonify({"error": str(e)}), 500
     
 
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """Stream a FAQ response as plain text tokens.
+
+    The client sees the first token in ~500ms instead of waiting for the
+    whole completion; formatting and context saving happen server-side
+    once the stream finishes."""
+    data = request.get_json()
+    message = data.get("message")
+    category = data.get("category")
+
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+
+    return Response(
+        stream_with_context(rag.stream_agentic_response_faq(message, category)),
+        mimetype='text/plain'
+    )
+
 @app.route('/api/consultation', methods=['POST'])
-def handle_consultation():
+async def handle_consultation():
     """Handle interactive consultation requests"""
     try:
         data = request.get_json()
         message = data.get("message", "")
         action_type = data.get("action_type", "text")  # text, button_click, form_submit
         session_id = data.get("session_id")
-        
+
         if not session_id:
             return jsonify({"error": "Session ID is required"}), 400
-        
+
         # Handle consultation flow
-        result = consultation_engine.handle_message(message, session_id, action_type)
+        result = await asyncio.to_thread(consultation_engine.handle_message, message, session_id, action_type)
         
         return jsonify(result)
-        
+
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("consultation request failed")
         return jsonify({"error": str(e)}), 500
     
 
@@ -217,7 +284,7 @@ def clear_data():
 def process_uploads_route():
     """Manually process existing files in uploads folder"""
     try:
-        stats = process_existing_uploads(verbose=False)
+        stats = process_existing_uploads(verbose=False, rag_system=rag)
         return jsonify({
             'message': 'Uploads processing completed',
             'stats': stats
@@ -1,43 +1,127 @@
-import fitz  # PyMuPDF
+import mmap
+import multiprocessing
 import re
 import os
+from concurrent.futures import ProcessPoolExecutor
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import UnstructuredRTFLoader
 
+# PyMuPDF and the unstructured RTF loader are heavy imports; they're pulled
+# in lazily inside the functions that need them so importing this module
+# (e.g. at Flask boot) stays cheap
 
-"""Extract chunks from PDF files"""
-def extract_chunks_from_pdf( file_bytes: bytes, filename: str, category: str = None, ):
-    print("Processing PDF file:", filename)
-    print("Category:", category)
-    
-    try:
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=50)
+# PDFs with at least this many pages are split across worker processes
+_PARALLEL_PAGE_THRESHOLD = 16
+_PAGE_RANGE_SIZE = 8
+
+# Shared splitters - constructing one compiles separator regexes, so pay
+# that cost once per process instead of once per file
+_PDF_CHUNK_SIZE = 200
+_RTF_CHUNK_SIZE = 800
+_PDF_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=_PDF_CHUNK_SIZE, chunk_overlap=50)
+_RTF_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=_RTF_CHUNK_SIZE, chunk_overlap=100)
+
+
+"""Split page/file text, passing it straight through when it already fits
+in one chunk - skips the splitter's separator recursion for short pages"""
+def _split_text(text: str, splitter, chunk_size: int):
+    if len(text) <= chunk_size:
+        return [text]
+    return splitter.split_text(text)
+
+# Fallback RTF parsing: one alternation strips commands, braces and
+# escaped backslashes in a single pass over the buffer
+_RTF_STRIP_RE = re.compile(r'\\(?:[a-z]+\d*\s?|[{}]|\\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_pool = None
+
+"""Lazily create the shared process pool for page-range extraction"""
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+
+"""Get page text via the "blocks" extractor, skipping MuPDF's full layout
+analysis; joining text blocks with blank lines keeps the paragraph
+boundaries the splitter wants."""
+def _page_text(page) -> str:
+    blocks = page.get_text("blocks")
+    # block type 0 = text, 1 = image
+    return "\n\n".join(block[4] for block in blocks if block[6] == 0)
+
+
+"""Worker: extract and split pages [start, end) of a PDF"""
+def _extract_page_range(file_path: str, start: int, end: int, filename: str, category: str = None):
+    import fitz  # PyMuPDF
 
-        chunks_with_metadata = []
+    doc = fitz.open(file_path)
+    cat = category or "Unknown"
 
+    chunks_with_metadata = []
+    for page_num in range(start, min(end, doc.page_count)):
+        page_text = _page_text(doc[page_num])
+
+        # Skip empty pages
+        if not page_text.strip():
+            continue
+
+        # The splitter never emits whitespace-only chunks from non-empty
+        # input, so a truthiness check is enough (no strip() copies)
+        chunks_with_metadata.extend(
+            (chunk, {
+                "source": filename,
+                "category": cat,
+                "page": page_num + 1,
+                "chunk_id": f"{filename}_{page_num+1}_{i}",
+                "file_type": "pdf"
+            })
+            for i, chunk in enumerate(_split_text(page_text, _PDF_SPLITTER, _PDF_CHUNK_SIZE)) if chunk
+        )
+
+    doc.close()
+    return chunks_with_metadata
+
+
+"""Yield (chunk, metadata) tuples from a PDF page by page"""
+def iter_chunks_from_pdf( file_path: str, filename: str, category: str = None, ):
+    import fitz  # PyMuPDF
+
+    # Open by path - MuPDF reads pages from the file on demand itself,
+    # and fitz.open(stream=...) only accepts bytes-like buffers
+    doc = fitz.open(file_path)
+    cat = category or "Unknown"
+    try:
         for page_num, page in enumerate(doc):
-            page_text = page.get_text("text")
-            
+            page_text = _page_text(page)
+
             # Skip empty pages
             if not page_text.strip():
                 continue
 
-            chunks = text_splitter.split_text(page_text)
+            chunks = _split_text(page_text, _PDF_SPLITTER, _PDF_CHUNK_SIZE)
             for i, chunk in enumerate(chunks):
-                if chunk.strip():  # Only add non-empty chunks
+                if chunk:  # splitter won't emit whitespace-only chunks
                     metadata = {
                         "source": filename,
-                        "category": category or "Unknown",
+                        "category": cat,
                         "page": page_num + 1,
                         "chunk_id": f"{filename}_{page_num+1}_{i}",
                         "file_type": "pdf"
                     }
-                    chunks_with_metadata.append((chunk, metadata))
-        
+                    yield (chunk, metadata)
+    finally:
         doc.close()
-        return chunks_with_metadata
-        
+
+
+"""Extract chunks from PDF files"""
+def extract_chunks_from_pdf( file_path: str, filename: str, category: str = None, ):
+    print("Processing PDF file:", filename)
+    print("Category:", category)
+
+    try:
+        return list(iter_chunks_from_pdf(file_path, filename, category))
     except Exception as e:
         print(f"Error processing PDF file {filename}: {e}")
         return []
@@ -50,6 +134,8 @@ def extract_chunks_from_rtf( file_path: str, filename: str, category: str = None
     
     try:
         # Use UnstructuredRTFLoader to load RTF content
+        from langchain_community.document_loaders import UnstructuredRTFLoader
+
         loader = UnstructuredRTFLoader(file_path, mode="elements", strategy="fast")
         documents = loader.load()
         
@@ -61,61 +147,49 @@ def extract_chunks_from_rtf( file_path: str, filename: str, category: str = None
             return []
         
         # Split into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-        chunks = text_splitter.split_text(full_text)
-        
-        chunks_with_metadata = []
-        for i, chunk in enumerate(chunks):
-            if chunk.strip():  # Only add non-empty chunks
-                metadata = {
-                    "source": filename,
-                    "category": category or "Unknown",
-                    "file_type": "rtf",
-                    "chunk_id": f"{filename}_{i}"
-                }
-                chunks_with_metadata.append((chunk, metadata))
-        
-        return chunks_with_metadata
+        cat = category or "Unknown"
+        return [
+            (chunk, {
+                "source": filename,
+                "category": cat,
+                "file_type": "rtf",
+                "chunk_id": f"{filename}_{i}"
+            })
+            for i, chunk in enumerate(_split_text(full_text, _RTF_SPLITTER, _RTF_CHUNK_SIZE)) if chunk
+        ]
         
     except Exception as e:
         print(f"  ⚠️  UnstructuredRTFLoader failed ({e}), trying fallback parser")
         
-        # Fallback: Simple RTF text extraction
+        # Fallback: Simple RTF text extraction. mmap the file and decode
+        # in one pass so the kernel readahead overlaps with the decode
+        # instead of text-mode read()'s incremental buffer copies
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # Remove RTF formatting codes (basic approach)
-            rtf_patterns = [
-                r'\\[a-z]+\d*\s?',  # RTF commands like \b, \f1, etc.
-                r'\\[{}]',          # RTF braces
-                r'\\[\\]',          # Escaped backslashes
-            ]
-            
-            for pattern in rtf_patterns:
-                content = re.sub(pattern, '', content)
-            
-            # Remove extra whitespace
-            content = re.sub(r'\s+', ' ', content).strip()
+            with open(file_path, 'rb') as f:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        content = mm[:].decode('utf-8', errors='ignore')
+                except (ValueError, OSError):
+                    # Empty or locked file - fall back to a full read
+                    content = f.read().decode('utf-8', errors='ignore')
+
+            # Remove RTF formatting codes (basic approach), then collapse
+            # whitespace - two passes instead of four
+            content = _WHITESPACE_RE.sub(' ', _RTF_STRIP_RE.sub('', content)).strip()
             
             if content:
                 print(f"  ✅ Successfully parsed with fallback parser")
                 # Split into chunks
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-                chunks = text_splitter.split_text(content)
-                
-                chunks_with_metadata = []
-                for i, chunk in enumerate(chunks):
-                    if chunk.strip():  # Only add non-empty chunks
-                        metadata = {
-                            "source": filename,
-                            "category": category or "Unknown",
-                            "file_type": "rtf",
-                            "chunk_id": f"{filename}_{i}"
-                        }
-                        chunks_with_metadata.append((chunk, metadata))
-                
-                return chunks_with_metadata
+                cat = category or "Unknown"
+                return [
+                    (chunk, {
+                        "source": filename,
+                        "category": cat,
+                        "file_type": "rtf",
+                        "chunk_id": f"{filename}_{i}"
+                    })
+                    for i, chunk in enumerate(_split_text(content, _RTF_SPLITTER, _RTF_CHUNK_SIZE)) if chunk
+                ]
             else:
                 print(f"  ❌ No text content found in RTF file {filename}")
                 return []
@@ -130,10 +204,37 @@ def extract_chunks_from_file( file_path: str, filename: str, category: str = Non
     file_extension = filename.lower().split('.')[-1]
     
     if file_extension == 'pdf':
-        # Read PDF as bytes
-        with open(file_path, "rb") as f:
-            file_bytes = f.read()
-        return extract_chunks_from_pdf(file_bytes, filename, category)
+        import fitz  # PyMuPDF
+
+        try:
+            doc = fitz.open(file_path)
+            page_count = doc.page_count
+            doc.close()
+        except Exception as e:
+            print(f"Error opening PDF file {filename}: {e}")
+            return []
+
+        # Large PDFs: pages are independent, so farm out page ranges to
+        # worker processes and merge results in submission order (keeps
+        # chunk_ids deterministic). Only the main process fans out:
+        # when this runs inside another pool's worker (the uploads
+        # scan extracts whole files in parallel), nesting a cpu-sized
+        # pool per worker would multiply to ~cpu^2 processes, so
+        # workers extract their file sequentially instead.
+        if page_count >= _PARALLEL_PAGE_THRESHOLD and multiprocessing.parent_process() is None:
+            print(f"Processing PDF file in parallel ({page_count} pages):", filename)
+            pool = _get_pool()
+            futures = [
+                pool.submit(_extract_page_range, file_path, start, start + _PAGE_RANGE_SIZE, filename, category)
+                for start in range(0, page_count, _PAGE_RANGE_SIZE)
+            ]
+            chunks_with_metadata = []
+            for future in futures:
+                chunks_with_metadata.extend(future.result())
+            return chunks_with_metadata
+
+        # Small PDFs: extracted in-process, straight from the file
+        return extract_chunks_from_pdf(file_path, filename, category)
     
     elif file_extension == 'rtf':
         return extract_chunks_from_rtf(file_path, filename, category)
@@ -141,3 +242,17 @@ def extract_chunks_from_file( file_path: str, filename: str, category: str = Non
     else:
         print(f"Unsupported file type: {file_extension}")
         return []
+
+
+"""Stream (chunk, metadata) tuples from a file without building the full list.
+
+PDFs are yielded page by page so callers can embed incrementally and keep
+peak memory constant; other formats fall back to the list-based extractor.
+"""
+def iter_chunks_from_file( file_path: str, filename: str, category: str = None, ):
+    file_extension = filename.lower().split('.')[-1]
+
+    if file_extension == 'pdf':
+        yield from iter_chunks_from_pdf(file_path, filename, category)
+    else:
+        yield from extract_chunks_from_file(file_path, filename, category)
@@ -1,85 +1,263 @@
 # consultation_engine.py - New dedicated file
+import array
+import collections
+import json
+import re
+import threading
+from bisect import bisect_right
+from enum import IntEnum
+from types import MappingProxyType
+
+
+# Compiled once at import so the hot handlers skip re's pattern-cache
+# lookup on every message. All name phrasings are fused into a single
+# alternation so extraction is one pass over the text instead of up to
+# three sequential searches; IGNORECASE replaces the manual .lower() copy.
+_NAME_RE = re.compile(
+    # The spoken phrases need whitespace before the name ("i amanda"
+    # must not yield "anda"); only the label forms may run straight on
+    r"(?:(?:my name is|i am|i'm|call me)\s+|(?:name is|name:)\s*)(\w+)|^(\w+)$",
+    re.IGNORECASE,
+)
+_CHOICE_RE = re.compile(r'[123]')
+
+# Token sets for the free-text assessment intro fallback; matching whole
+# tokens avoids substring false-positives ("noted" no longer hits "no")
+_START_WORDS = frozenset({'start', 'begin', 'yes', 'ready'})
+_SKIP_WORDS = frozenset({'skip', 'no', 'later'})
+
+# Score-percentage thresholds mapped to levels, kept sorted so the level
+# lookup is a bisect instead of an if/elif chain and thresholds can be
+# tuned in one place
+_LEVEL_THRESHOLDS = [(0, 'beginner'), (60, 'intermediate'), (80, 'advanced')]
+_LEVEL_CUTOFFS = [t for t, _ in _LEVEL_THRESHOLDS]
+
+
+"""Coerce a form_submit payload to a dict, or None if it isn't one.
+The transport layer already parses the request body, so dicts pass
+through untouched; JSON strings are parsed here only for backward
+compatibility with older callers."""
+def _coerce_form(user_input):
+    if isinstance(user_input, dict):
+        return user_input
+    if isinstance(user_input, str):
+        try:
+            parsed = json.loads(user_input)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+"""Map an assessment score percentage to a level name"""
+def _percentage_to_level(percentage: int) -> str:
+    return _LEVEL_THRESHOLDS[bisect_right(_LEVEL_CUTOFFS, percentage) - 1][1]
+
+
+# Static ui_elements payloads shared across all sessions. Handlers (and
+# callers) only ever read these, so returning the same nested structures
+# by reference saves rebuilding them on every render. The outer dicts are
+# wrapped in MappingProxyType so an accidental in-place mutation raises
+# instead of corrupting every future session (the JSON providers in
+# app.py know how to serialize the proxies).
+_WELCOME_UI = MappingProxyType({
+    'type': 'form',
+    'fields': [
+        {
+            'id': 'name',
+            'type': 'text',
+            'label': "What's your name (or your child's name)?",
+            'placeholder': 'Enter name here...',
+            'required': True
+        }
+    ],
+    'submit_button': 'Continue',
+    'action': 'submit_name'
+})
+
+_ASSESSMENT_INTRO_UI = MappingProxyType({
+    'type': 'action_buttons',
+    'buttons': [
+        {
+            'id': 'start_assessment',
+            'text': 'Start Assessment',
+            'style': 'primary',
+            'action': 'button_click'
+        },
+        {
+            'id': 'skip_assessment',
+            'text': 'Skip Assessment',
+            'style': 'secondary',
+            'action': 'button_click'
+        }
+    ]
+})
+
+_ERROR_UI = MappingProxyType({
+    'type': 'action_buttons',
+    'buttons': [
+        {
+            'id': 'restart_consultation',
+            'text': 'Start New Consultation',
+            'style': 'primary',
+            'action': 'button_click'
+        }
+    ]
+})
+
+# Mock course data - replace with real course catalog. Built once at
+# import and shared across sessions; callers only iterate the entries,
+# which are frozen below against accidental mutation.
+_RAW_CATALOG = {
+    'beginner': [
+        {
+            'id': 'beg001',
+            'name': 'English Foundations',
+            'duration': '8 weeks',
+            'schedule': 'Tue/Thu 4-5pm',
+            'description': 'Perfect for building basic English skills with fun activities and games.'
+        },
+        {
+            'id': 'beg002',
+            'name': 'Speaking & Listening Starter',
+            'duration': '6 weeks',
+            'schedule': 'Mon/Wed 4-5pm',
+            'description': 'Focus on conversation skills and pronunciation for beginners.'
+        }
+    ],
+    'intermediate': [
+        {
+            'id': 'int001',
+            'name': 'Grammar & Conversation',
+            'duration': '10 weeks',
+            'schedule': 'Tue/Thu 5-6pm',
+            'description': 'Strengthen grammar while practicing real-world conversations.'
+        },
+        {
+            'id': 'int002',
+            'name': 'Reading & Writing Plus',
+            'duration': '8 weeks',
+            'schedule': 'Mon/Wed 5-6pm',
+            'description': 'Improve reading comprehension and writing skills.'
+        }
+    ],
+    'advanced': [
+        {
+            'id': 'adv001',
+            'name': 'Advanced Communication',
+            'duration': '12 weeks',
+            'schedule': 'Tue/Thu 6-7pm',
+            'description': 'Master complex topics and advanced grammar structures.'
+        }
+    ]
+}
+
+_COURSE_CATALOG = {
+    level: tuple(MappingProxyType(course) for course in courses)
+    for level, courses in _RAW_CATALOG.items()
+}
+
+
+class Stage(IntEnum):
+    """Consultation flow stages; int-valued so comparisons are single CMPs
+    and the dispatch table can be a plain list"""
+    WELCOME = 0
+    BASIC_INFO = 1
+    ASSESSMENT_INTRO = 2
+    ASSESSMENT_ACTIVE = 3
+    RECOMMENDATIONS = 4
+    ASSESSMENT_COMPLETE = 5
+    ERROR = 6
+
+
 class ConsultationEngine:
     """Interactive consultation engine that returns structured UI data"""
     
     def __init__(self, rag_system):
         self.rag = rag_system
-        self.sessions = {}
+        # LRU-ordered session pool: a plain dict would grow forever (one
+        # ConsultationSession leaked per unique session_id), so cap the
+        # pool and evict the least recently used session at the limit
+        self.sessions = collections.OrderedDict()
+        self._max_sessions = 10_000
+        # Striped locks: sessions with different ids map to different
+        # stripes and never contend; only concurrent requests for the
+        # same session serialize
+        self._stripes = [threading.Lock() for _ in range(64)]
+        # Stage -> handler dispatch table indexed by Stage int value: one
+        # list index per message instead of an if/elif chain
+        self._handlers = [
+            self._handle_welcome,            # Stage.WELCOME
+            self._handle_basic_info,         # Stage.BASIC_INFO
+            self._handle_assessment_intro,   # Stage.ASSESSMENT_INTRO
+            self._handle_assessment_question,  # Stage.ASSESSMENT_ACTIVE
+            self._handle_recommendations,    # Stage.RECOMMENDATIONS
+        ]
 
     def handle_message(self, user_input: str, session_id: str, action_type: str = "text") -> dict:
         """
         Handle consultation messages and return structured response
-        
+
         Args:
-            user_input: User's text input or action data
+            user_input: User's text input or action data; form_submit
+                callers should pass the already-parsed dict
             session_id: Session identifier
             action_type: "text", "button_click", "form_submit", etc.
-            
+
         Returns:
             dict with response text, UI elements, and next actions
         """
-        session = self.get_or_create_session(session_id)
-        
-        # Route based on current stage
-        if session.stage == 'welcome':
-            return self._handle_welcome(user_input, session, action_type)
-        elif session.stage == 'basic_info':
-            return self._handle_basic_info(user_input, session, action_type)
-        elif session.stage == 'assessment_intro':
-            return self._handle_assessment_intro(user_input, session, action_type)
-        elif session.stage == 'assessment_active':
-            return self._handle_assessment_question(user_input, session, action_type)
-        elif session.stage == 'recommendations':
-            return self._handle_recommendations(user_input, session, action_type)
-        else:
+        # Hold the session's stripe lock across the handler so concurrent
+        # requests for the same session can't interleave stage mutations
+        with self._lock_for(session_id):
+            session = self.get_or_create_session(session_id)
+
+            # Route based on current stage
+            if 0 <= session.stage < len(self._handlers):
+                return self._handlers[session.stage](user_input, session, action_type)
             return self._create_error_response("Invalid session state")
 
+    def _lock_for(self, session_id: str):
+        return self._stripes[hash(session_id) & 63]
+
     def get_or_create_session(self, session_id: str):
-        if session_id not in self.sessions:
-            self.sessions[session_id] = ConsultationSession(session_id)
-        return self.sessions[session_id]
+        session = self.sessions.get(session_id)
+        if session is None:
+            if len(self.sessions) >= self._max_sessions:
+                self.sessions.popitem(last=False)  # evict oldest
+            session = ConsultationSession(session_id)
+            self.sessions[session_id] = session
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
 
     """Handle initial welcome and name collection"""
     def _handle_welcome(self, user_input: str, session: 'ConsultationSession', action_type: str) -> dict:
         
         if action_type == "form_submit":
             # Handle form data submission
-            import json
-            try:
-                form_data = json.loads(user_input) if isinstance(user_input, str) else user_input
-                if 'name' in form_data and form_data['name'].strip():
-                    session.data['name'] = form_data['name'].strip()
-                    session.stage = 'basic_info'
-                    return self._create_basic_info_response(session)
-            except:
-                pass  # Fall through to show form again
+            form_data = _coerce_form(user_input)
+            name = form_data.get('name') if form_data else None
+            if isinstance(name, str) and name.strip():
+                session.data['name'] = name.strip()
+                session.stage = Stage.BASIC_INFO
+                return self._create_basic_info_response(session)
+            # Fall through to show form again
         
         elif action_type == "text":
             # Try to extract name from natural input
             extracted = self._extract_name(user_input)
             if extracted:
                 session.data['name'] = extracted
-                session.stage = 'basic_info'
+                session.stage = Stage.BASIC_INFO
                 return self._create_basic_info_response(session)
     
         # Show name input form if no name detected or form_submit failed
         return {
             'response': "I'd love to help you find the perfect English program! Let's start with some basic information.",
-            'ui_elements': {
-                'type': 'form',
-                'fields': [
-                    {
-                        'id': 'name',
-                        'type': 'text',
-                        'label': "What's your name (or your child's name)?",
-                        'placeholder': 'Enter name here...',
-                        'required': True
-                    }
-                ],
-                'submit_button': 'Continue',
-                'action': 'submit_name'
-            },
-            'stage': 'welcome',
+            'ui_elements': _WELCOME_UI,
+            'stage': session.stage.name.lower(),
             'allow_text_input': True,
             'text_fallback': "You can also just type your name if you prefer."
         }
@@ -90,27 +268,23 @@ class ConsultationEngine:
         
         if action_type == "form_submit":
             # Handle form data (age, level)
-            import json
-            try:
-                form_data = json.loads(user_input) if isinstance(user_input, str) else user_input
-                session.data.update(form_data)
-                session.stage = 'assessment_intro'
-                return self._create_assessment_intro_response(session)
-            except:
+            form_data = _coerce_form(user_input)
+            if form_data is None:
                 return self._create_error_response("Invalid form data")
+            session.data.update(form_data)
+            session.stage = Stage.ASSESSMENT_INTRO
+            return self._create_assessment_intro_response(session)
         
         if action_type == "button_click":
             # Handle individual button clicks (age ranges, levels)
             if user_input.startswith("age_"):
-                age_range = user_input.replace("age_", "")
-                session.data['age_range'] = age_range
+                session.data['age_range'] = user_input.removeprefix("age_")
             elif user_input.startswith("level_"):
-                level = user_input.replace("level_", "")
-                session.data['level'] = level
+                session.data['level'] = user_input.removeprefix("level_")
             
             # Check if we have enough info to proceed
             if 'age_range' in session.data and 'level' in session.data:
-                session.stage = 'assessment_intro'
+                session.stage = Stage.ASSESSMENT_INTRO
                 return self._create_assessment_intro_response(session)
         
         # Show basic info collection interface
@@ -132,7 +306,7 @@ class ConsultationEngine:
             response = f"Perfect! Last question - what's the current English level?"
         else:
             # Shouldn't happen, but fallback
-            session.stage = 'assessment_intro'
+            session.stage = Stage.ASSESSMENT_INTRO
             return self._create_assessment_intro_response(session)
 
         ui_elements = {'type': 'multi_section', 'sections': []}
@@ -164,7 +338,7 @@ class ConsultationEngine:
         return {
             'response': response,
             'ui_elements': ui_elements,
-            'stage': 'basic_info',
+            'stage': session.stage.name.lower(),
             'allow_text_input': True,
             'text_fallback': "You can also type your answer if you prefer."
         }
@@ -181,24 +355,8 @@ class ConsultationEngine:
 
         return {
             'response': response,
-            'ui_elements': {
-                'type': 'action_buttons',
-                'buttons': [
-                    {
-                        'id': 'start_assessment',
-                        'text': 'Start Assessment',
-                        'style': 'primary',
-                        'action': 'button_click'
-                    },
-                    {
-                        'id': 'skip_assessment', 
-                        'text': 'Skip Assessment',
-                        'style': 'secondary',
-                        'action': 'button_click'
-                    }
-                ]
-            },
-            'stage': 'assessment_intro',
+            'ui_elements': _ASSESSMENT_INTRO_UI,
+            'stage': session.stage.name.lower(),
             'allow_text_input': False
         }
 
@@ -206,21 +364,22 @@ class ConsultationEngine:
         """Handle assessment start/skip decision"""
         if action_type == "button_click":
             if user_input == "start_assessment":
-                session.stage = 'assessment_active'
+                session.stage = Stage.ASSESSMENT_ACTIVE
                 session.current_question = 0
                 return self._get_assessment_question(session)
             elif user_input == "skip_assessment":
-                session.stage = 'recommendations'
+                session.stage = Stage.RECOMMENDATIONS
                 session.assessed_level = session.data.get('level', 'intermediate')
                 return self._create_recommendations_response(session)
         
-        # Fallback for text input
-        if any(word in user_input.lower() for word in ['start', 'begin', 'yes', 'ready']):
-            session.stage = 'assessment_active'
+        # Fallback for text input - lowercase and tokenize once
+        words = user_input.lower().split()
+        if any(word in _START_WORDS for word in words):
+            session.stage = Stage.ASSESSMENT_ACTIVE
             session.current_question = 0
             return self._get_assessment_question(session)
-        elif any(word in user_input.lower() for word in ['skip', 'no', 'later']):
-            session.stage = 'recommendations'
+        elif any(word in _SKIP_WORDS for word in words):
+            session.stage = Stage.RECOMMENDATIONS
             session.assessed_level = session.data.get('level', 'intermediate')
             return self._create_recommendations_response(session)
         
@@ -232,8 +391,12 @@ class ConsultationEngine:
         if action_type == "button_click":
             # Handle answer button click
             if user_input.startswith("answer_"):
-                choice = int(user_input.replace("answer_", ""))
-                return self._process_assessment_answer(choice, session)
+                try:
+                    choice = int(user_input.removeprefix("answer_"))
+                except ValueError:
+                    choice = None
+                if choice is not None:
+                    return self._process_assessment_answer(choice, session)
         
         # Handle text input - try to extract choice
         choice = self._extract_choice_from_text(user_input)
@@ -246,56 +409,39 @@ class ConsultationEngine:
     def _get_assessment_question(self, session: 'ConsultationSession', error_message: str = None) -> dict:
         """Get current assessment question with interactive buttons"""
         
-        if session.current_question >= len(ASSESSMENT_QUESTIONS):
+        if session.current_question >= _TOTAL_QUESTIONS:
             # Assessment complete
             return self._complete_assessment(session)
-        
-        question = ASSESSMENT_QUESTIONS[session.current_question]
-        question_num = session.current_question + 1
-        total_questions = len(ASSESSMENT_QUESTIONS)
-        
-        response = f"Question {question_num} of {total_questions}:\n\n{question['question']}"
+
+        # Questions are static, so header, progress and answer buttons are
+        # precomputed in _QUESTION_CACHE; handlers only read them, so the
+        # cached lists/dicts are shared by reference across sessions
+        cached = _QUESTION_CACHE[session.current_question]
+
+        response = cached['header']
         if error_message:
             response = f"{error_message}\n\n{response}"
 
-        # Create answer buttons
-        answer_buttons = []
-        for i, option in enumerate(question['options'], 1):
-            answer_buttons.append({
-                'id': f'answer_{i}',
-                'text': f"{i}. {option}",
-                'action': 'button_click',
-                'style': 'answer_option'
-            })
-
         return {
             'response': response,
             'ui_elements': {
                 'type': 'question_interface',
-                'progress': {
-                    'current': question_num,
-                    'total': total_questions,
-                    'percentage': int((question_num / total_questions) * 100)
-                },
-                'answers': answer_buttons
+                'progress': cached['progress'],
+                'answers': cached['answers']
             },
-            'stage': 'assessment_active',
+            'stage': session.stage.name.lower(),
             'allow_text_input': True,
             'text_fallback': "You can also type 1, 2, or 3 for your answer."
         }
 
     def _process_assessment_answer(self, choice: int, session: 'ConsultationSession') -> dict:
         """Process assessment answer and move to next question"""
-        # Record the answer
+        # Record the answer - a running correct counter plus a compact
+        # byte array of choices instead of one dict per answer
         question = ASSESSMENT_QUESTIONS[session.current_question]
-        is_correct = choice == question['correct_answer']
-        
-        session.assessment_answers.append({
-            'question': session.current_question,
-            'choice': choice,
-            'correct': is_correct
-        })
-        
+        session.correct_count += choice == question['correct_answer']
+        session.answer_choices.append(choice)
+
         session.current_question += 1
         
         # Move to next question or complete assessment
@@ -303,18 +449,13 @@ class ConsultationEngine:
 
     def _complete_assessment(self, session: 'ConsultationSession') -> dict:
         """Complete assessment and calculate results"""
-        correct_count = sum(1 for answer in session.assessment_answers if answer['correct'])
-        total_questions = len(session.assessment_answers)
+        correct_count = session.correct_count
+        total_questions = len(session.answer_choices)
         percentage = int((correct_count / total_questions) * 100) if total_questions > 0 else 0
         
         # Determine level
-        if percentage >= 80:
-            level = 'advanced'
-        elif percentage >= 60:
-            level = 'intermediate'
-        else:
-            level = 'beginner'
-        
+        level = _percentage_to_level(percentage)
+
         session.assessed_level = level
         session.assessment_results = {
             'correct': correct_count,
@@ -323,7 +464,7 @@ class ConsultationEngine:
             'level': level
         }
         
-        session.stage = 'recommendations'
+        session.stage = Stage.RECOMMENDATIONS
         
         # Show results with transition to recommendations
         response = f"Assessment Complete! 🎉\n\nYou scored {correct_count}/{total_questions} ({percentage}%)\nRecommended level: {level.title()}"
@@ -395,98 +536,36 @@ class ConsultationEngine:
                     }
                 ]
             },
-            'stage': 'recommendations',
+            'stage': session.stage.name.lower(),
             'allow_text_input': True
         }
 
     def _generate_course_recommendations(self, session: 'ConsultationSession') -> list:
         """Generate course recommendations based on session data"""
         level = session.assessed_level or session.data.get('level', 'intermediate')
-        age_range = session.data.get('age_range', '7-10')
-        
-        # Mock course data - replace with real course catalog
-        course_catalog = {
-            'beginner': [
-                {
-                    'id': 'beg001',
-                    'name': 'English Foundations',
-                    'duration': '8 weeks',
-                    'schedule': 'Tue/Thu 4-5pm',
-                    'description': 'Perfect for building basic English skills with fun activities and games.'
-                },
-                {
-                    'id': 'beg002', 
-                    'name': 'Speaking & Listening Starter',
-                    'duration': '6 weeks',
-                    'schedule': 'Mon/Wed 4-5pm',
-                    'description': 'Focus on conversation skills and pronunciation for beginners.'
-                }
-            ],
-            'intermediate': [
-                {
-                    'id': 'int001',
-                    'name': 'Grammar & Conversation',
-                    'duration': '10 weeks', 
-                    'schedule': 'Tue/Thu 5-6pm',
-                    'description': 'Strengthen grammar while practicing real-world conversations.'
-                },
-                {
-                    'id': 'int002',
-                    'name': 'Reading & Writing Plus',
-                    'duration': '8 weeks',
-                    'schedule': 'Mon/Wed 5-6pm', 
-                    'description': 'Improve reading comprehension and writing skills.'
-                }
-            ],
-            'advanced': [
-                {
-                    'id': 'adv001',
-                    'name': 'Advanced Communication',
-                    'duration': '12 weeks',
-                    'schedule': 'Tue/Thu 6-7pm',
-                    'description': 'Master complex topics and advanced grammar structures.'
-                }
-            ]
-        }
-        
-        return course_catalog.get(level, course_catalog['intermediate'])
+        return _COURSE_CATALOG.get(level, _COURSE_CATALOG['intermediate'])
 
     def _extract_name(self, text: str) -> str:
         """Extract name from natural language input"""
-        import re
-        patterns = [
-            r"(?:my name is|i am|i'm|call me)\s+(\w+)",
-            r"(?:name is|name:)\s*(\w+)",
-            r"^(\w+)$"  # Single word responses
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text.lower())
-            if match:
-                return match.group(1).title()
-        return None
+        match = _NAME_RE.search(text)
+        if not match:
+            return None
+        return (match.group(1) or match.group(2)).title()
 
     def _extract_choice_from_text(self, text: str) -> int:
         """Extract choice number from text"""
-        import re
-        match = re.search(r'[123]', text)
+        # Fast path: the input is usually just "1"/"2"/"3"
+        s = text.strip()
+        if len(s) == 1 and s in '123':
+            return int(s)
+        match = _CHOICE_RE.search(text)
         return int(match.group()) if match else None
 
     def _create_error_response(self, message: str) -> dict:
         """Create error response"""
         return {
             'response': f"I'm sorry, {message}. Let's start over.",
-            'ui_elements': {
-                'type': 'action_buttons',
-                'buttons': [
-                    {
-                        'id': 'restart_consultation',
-                        'text': 'Start New Consultation',
-                        'style': 'primary',
-                        'action': 'button_click'
-                    }
-                ]
-            },
+            'ui_elements': _ERROR_UI,
             'stage': 'error',
             'allow_text_input': False
         }
@@ -494,13 +573,21 @@ class ConsultationEngine:
 
 class ConsultationSession:
     """Individual consultation session state"""
-    
+
+    # Sessions are created per user and pooled by the thousand; slots
+    # drop the per-instance __dict__ and make attribute access a fixed
+    # offset instead of a dict lookup
+    __slots__ = ('session_id', 'stage', 'data', 'current_question',
+                 'correct_count', 'answer_choices', 'assessment_results',
+                 'assessed_level')
+
     def __init__(self, session_id: str):
         self.session_id = session_id
-        self.stage = 'welcome'
+        self.stage = Stage.WELCOME
         self.data = {}
         self.current_question = 0
-        self.assessment_answers = []
+        self.correct_count = 0
+        self.answer_choices = array.array('b')
         self.assessment_results = {}
         self.assessed_level = None
 
@@ -558,4 +645,30 @@ ASSESSMENT_QUESTIONS = [
         ],
         'correct_answer': 2
     }
-]
\ No newline at end of file
+]
+_TOTAL_QUESTIONS = len(ASSESSMENT_QUESTIONS)
+
+# Precomputed render data for each assessment question: the formatted
+# header, progress dict and answer buttons never change, so build them
+# once at import instead of on every question render. Handlers must not
+# mutate these entries.
+_QUESTION_CACHE = [
+    MappingProxyType({
+        'header': f"Question {i + 1} of {_TOTAL_QUESTIONS}:\n\n{q['question']}",
+        'progress': MappingProxyType({
+            'current': i + 1,
+            'total': _TOTAL_QUESTIONS,
+            'percentage': int((i + 1) / _TOTAL_QUESTIONS * 100)
+        }),
+        'answers': tuple(
+            MappingProxyType({
+                'id': f'answer_{j}',
+                'text': f"{j}. {option}",
+                'action': 'button_click',
+                'style': 'answer_option'
+            })
+            for j, option in enumerate(q['options'], 1)
+        )
+    })
+    for i, q in enumerate(ASSESSMENT_QUESTIONS)
+]
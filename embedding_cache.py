@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+SQLite-backed embedding cache keyed by chunk content hash.
+
+Embedding API calls dominate ingest time. Re-processing an edited file
+re-embeds every chunk even when most are unchanged; caching vectors by
+SHA-256 of the chunk text makes unchanged chunks a local database read
+instead of an API round trip.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+CACHE_DB = "./vector_cache/embedding_cache.db"
+
+_conn = None
+_lock = threading.Lock()
+
+"""Open (and initialize) the cache database once per process"""
+def _get_conn():
+    global _conn
+    if _conn is None:
+        cache_dir = os.path.dirname(CACHE_DB)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        _conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vec BLOB)"
+        )
+        _conn.commit()
+    return _conn
+
+"""SHA-256 hex digest of a chunk's text - the cache key"""
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+"""Look up one cached vector, or None on a miss"""
+def get_cached(sha256_hex: str) -> Optional[np.ndarray]:
+    with _lock:
+        row = _get_conn().execute(
+            "SELECT vec FROM embeddings WHERE hash = ?", (sha256_hex,)
+        ).fetchone()
+    if row is None:
+        return None
+    return np.frombuffer(row[0], dtype=np.float32)
+
+"""Look up many hashes at once; returns {hash: vector} for the hits"""
+def get_cached_many(hashes: List[str]) -> Dict[str, np.ndarray]:
+    if not hashes:
+        return {}
+    hits = {}
+    unique = list(set(hashes))
+    with _lock:
+        conn = _get_conn()
+        # SQLite caps bound parameters per statement, so query in slices
+        for start in range(0, len(unique), 500):
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for h, blob in conn.execute(
+                f"SELECT hash, vec FROM embeddings WHERE hash IN ({placeholders})", batch
+            ):
+                hits[h] = np.frombuffer(blob, dtype=np.float32)
+    return hits
+
+"""Store one vector under its content hash"""
+def put_cached(sha256_hex: str, vector: List[float]):
+    put_cached_many([(sha256_hex, vector)])
+
+"""Store many (hash, vector) pairs in one transaction"""
+def put_cached_many(items: List[Tuple[str, List[float]]]):
+    if not items:
+        return
+    rows = [
+        (h, np.asarray(vec, dtype=np.float32).tobytes())
+        for h, vec in items
+    ]
+    with _lock:
+        conn = _get_conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)", rows
+        )
+        conn.commit()
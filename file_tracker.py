@@ -3,37 +3,125 @@
 File tracking utilities to prevent duplicate adding of files.
 """
 
+import atexit
 import os
-import json
-from typing import Set
+import hashlib
+from typing import Optional, Set
+
+# Append-only tracker log: one entry per line, filenames as-is and
+# content hashes prefixed with "sha256:". Marking a file appends one
+# short line instead of rewriting the whole tracker, and order doesn't
+# matter because the entries form a set.
+TRACKER_FILE = "processed_files.txt"
+_LEGACY_TRACKER_FILE = "processed_files.json"
+_HASH_PREFIX = "sha256:"
+
+_files_cache: Optional[Set[str]] = None
+_hashes_cache: Optional[Set[str]] = None
+_log_fh = None
+
+"""Compute the SHA-256 content hash of a file.
+file_digest reads via OS-level readinto and uses SHA-NI when available."""
+def hash_file(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+"""One-time migration from the old JSON tracker format"""
+def _load_legacy() -> tuple:
+    try:
+        import json
+        with open(_LEGACY_TRACKER_FILE, 'r') as f:
+            data = json.load(f)
+        return set(data.get('processed_files', [])), set(data.get('processed_hashes', []))
+    except (OSError, ValueError, AttributeError):
+        # ValueError covers json.JSONDecodeError
+        return set(), set()
+
+"""Populate the in-process caches from the log (first call only)"""
+def _ensure_loaded():
+    global _files_cache, _hashes_cache
+    if _files_cache is not None:
+        return
+    _files_cache = set()
+    _hashes_cache = set()
+    if os.path.exists(TRACKER_FILE):
+        with open(TRACKER_FILE, 'r') as f:
+            for line in f:
+                entry = line.rstrip('\n')
+                if not entry:
+                    continue
+                if entry.startswith(_HASH_PREFIX):
+                    _hashes_cache.add(entry[len(_HASH_PREFIX):])
+                else:
+                    _files_cache.add(entry)
+    elif os.path.exists(_LEGACY_TRACKER_FILE):
+        # Carry old JSON tracker state forward into the log format
+        _files_cache, _hashes_cache = _load_legacy()
+        f = _open_log()
+        for filename in _files_cache:
+            f.write(filename + '\n')
+        for content_hash in _hashes_cache:
+            f.write(_HASH_PREFIX + content_hash + '\n')
+        f.flush()
+
+"""Lazily open the append-only log once per process"""
+def _open_log():
+    global _log_fh
+    if _log_fh is None or _log_fh.closed:
+        _log_fh = open(TRACKER_FILE, 'a')
+    return _log_fh
 
 """Get set of files which have already been processed"""
 def get_processed_files() -> Set[str]:
-    processed_file = "processed_files.json"
-    if os.path.exists(processed_file):
-        try:
-            with open(processed_file, 'r') as f:
-                data = json.load(f)
-                return set(data.get('processed_files', []))
-        except:
-            return set()
-    return set()
-
-def mark_file_processed(filename: str):
-    """Mark a file as processed"""
-    processed_file = "processed_files.json"
-    processed_files = get_processed_files()
-    processed_files.add(filename)
-    
+    _ensure_loaded()
+    return _files_cache
+
+"""Get set of content hashes which have already been processed.
+Catches renamed copies and unchanged files on redeploys, where the
+filename check alone would re-embed everything."""
+def get_processed_hashes() -> Set[str]:
+    _ensure_loaded()
+    return _hashes_cache
+
+def mark_file_processed(filename: str, content_hash: Optional[str] = None):
+    """Mark a file (and optionally its content hash) as processed.
+
+    Appends O(len(filename)) bytes to the log - no re-serialize of the
+    whole tracker."""
+    _ensure_loaded()
     try:
-        with open(processed_file, 'w') as f:
-            json.dump({'processed_files': list(processed_files)}, f)
+        f = _open_log()
+        if filename not in _files_cache:
+            f.write(filename + '\n')
+        if content_hash and content_hash not in _hashes_cache:
+            f.write(_HASH_PREFIX + content_hash + '\n')
+        f.flush()
     except Exception as e:
         print(f"Warning: Could not save processed files list: {e}")
+    _files_cache.add(filename)
+    if content_hash:
+        _hashes_cache.add(content_hash)
+
+def flush_processed_files():
+    """Flush buffered log writes to disk (appends are already synchronous
+    per mark; kept for callers that batch)"""
+    if _log_fh is not None and not _log_fh.closed:
+        _log_fh.flush()
+
+atexit.register(flush_processed_files)
 
 def clear_processed_files():
     """Clear the list of processed files (useful for reprocessing all files)"""
-    processed_file = "processed_files.json"
-    if os.path.exists(processed_file):
-        os.remove(processed_file)
+    global _files_cache, _hashes_cache, _log_fh
+    _files_cache = set()
+    _hashes_cache = set()
+    if _log_fh is not None and not _log_fh.closed:
+        _log_fh.close()
+        _log_fh = None
+    removed = False
+    for path in (TRACKER_FILE, _LEGACY_TRACKER_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    if removed:
         print("✅ Cleared processed files list")
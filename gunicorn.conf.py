@@ -0,0 +1,10 @@
+# Gunicorn configuration for production deployments: gunicorn app:app
+#
+# preload_app imports the application (and loads the InMemoryRAG caches)
+# once in the master before forking, so the knowledge-base pages are
+# shared copy-on-write across workers instead of duplicated per worker.
+preload_app = True
+workers = 4
+worker_class = "gthread"
+threads = 4
+bind = "0.0.0.0:5000"
@@ -6,17 +6,27 @@ This script can be run independently or integrated into the main application sta
 
 import os
 import sys
-from pathlib import Path
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 import argparse
 
 # Add the current directory to Python path to import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+logger = logging.getLogger(__name__)
+
 from rag_inmemory import InMemoryRAG
 from chunking import extract_chunks_from_file
-from utils import store_embeddings_with_metadata
-from file_tracker import get_processed_files, mark_file_processed
+from utils import store_embeddings_with_metadata, store_embeddings_batched
+from file_tracker import (
+    get_processed_files,
+    get_processed_hashes,
+    hash_file,
+    mark_file_processed,
+    flush_processed_files,
+)
 
 # Default categories for different file types
 DEFAULT_CATEGORIES = {
@@ -26,40 +36,54 @@ DEFAULT_CATEGORIES = {
     'docx': 'Document'
 }
 
+# Filename patterns checked in priority order (custom patterns are
+# prepended at match time and win over these)
+_DEFAULT_PATTERNS = (
+    ('curriculum', 'Curriculum'),
+    ('pricing', 'Pricing'),
+    ('teacher', 'Teachers'),
+    ('general', 'General Information'),
+    ('guide', 'User Guide'),
+    ('manual', 'User Guide'),
+)
+
+@functools.lru_cache(maxsize=4096)
+def _categorize(filename: str, pattern_items: tuple) -> str:
+    """Memoized categorization - repeat lookups for the same filename
+    (scan, process, re-scan) skip the lowering and pattern scan"""
+    return _compile_category_dispatch(pattern_items)(filename)
+
+@functools.lru_cache(maxsize=8)
+def _compile_category_dispatch(pattern_items: tuple):
+    """
+    Generate a categorizer specialized to one pattern set: the merged
+    (pattern, category) table is inlined into source as a chain of
+    substring tests and exec'd once, so the per-file call carries no
+    table iteration at all - partial evaluation of get_file_category.
+    """
+    lines = ["def _cat(filename):", "    s = filename.lower()"]
+    for pattern, category in pattern_items:
+        lines.append(f"    if {pattern.lower()!r} in s: return {category!r}")
+    lines.append("    return DEFAULT_CATEGORIES.get(s.rpartition('.')[2], 'Documentation')")
+    namespace = {'DEFAULT_CATEGORIES': DEFAULT_CATEGORIES}
+    exec("\n".join(lines), namespace)
+    return namespace['_cat']
+
 def get_file_category(filename: str, custom_categories: Dict[str, str] = None) -> str:
     """
     Determine category for a file based on filename patterns or custom mapping.
-    
+
     Args:
         filename: Name of the file
         custom_categories: Custom mapping of filename patterns to categories
-    
+
     Returns:
         Category string for the file
     """
-    filename_lower = filename.lower()
-    
-    # Custom category mapping (can be extended)
+    pattern_items = _DEFAULT_PATTERNS
     if custom_categories:
-        for pattern, category in custom_categories.items():
-            if pattern.lower() in filename_lower:
-                return category
-    
-    # Default pattern-based categorization
-    if 'curriculum' in filename_lower:
-        return 'Curriculum'
-    elif 'pricing' in filename_lower:
-        return 'Pricing'
-    elif 'teacher' in filename_lower:
-        return 'Teachers'
-    elif 'general' in filename_lower:
-        return 'General Information'
-    elif 'guide' in filename_lower or 'manual' in filename_lower:
-        return 'User Guide'
-    else:
-        # Fallback to file extension
-        file_ext = filename.split('.')[-1].lower()
-        return DEFAULT_CATEGORIES.get(file_ext, 'Documentation')
+        pattern_items = tuple(custom_categories.items()) + pattern_items
+    return _categorize(filename, pattern_items)
 
 def scan_uploads_folder(uploads_path: str) -> List[Tuple[str, str]]:
     """
@@ -73,34 +97,92 @@ def scan_uploads_folder(uploads_path: str) -> List[Tuple[str, str]]:
     """
     supported_extensions = {'.pdf', '.rtf', '.txt', '.docx'}
     files_found = []
-    processed_files = get_processed_files()
+    # Snapshot the tracker state as frozensets before the loop: membership
+    # checks per entry are hash lookups, and the snapshot can't be
+    # mutated behind the scan by concurrent mark_file_processed calls
+    processed_files = frozenset(get_processed_files())
+    processed_hashes = frozenset(get_processed_hashes())
     
     if not os.path.exists(uploads_path):
-        print(f"❌ Uploads folder not found: {uploads_path}")
+        logger.error(f"❌ Uploads folder not found: {uploads_path}")
         return files_found
     
-    print(f"🔍 Scanning uploads folder: {uploads_path}")
+    logger.info(f"🔍 Scanning uploads folder: {uploads_path}")
     
-    for filename in os.listdir(uploads_path):
-        file_path = os.path.join(uploads_path, filename)
-        
-        # Skip directories and hidden files
-        if os.path.isdir(file_path) or filename.startswith('.'):
-            continue
-        
-        # Check if file has supported extension
-        file_ext = Path(filename).suffix.lower()
-        if file_ext in supported_extensions:
-            if filename in processed_files:
-                print(f"  ✅ Already processed: {filename}")
+    # scandir returns DirEntry objects with the file type cached from the
+    # directory read, so is_dir() costs no extra stat() per entry the way
+    # listdir + os.path.isdir did
+    with os.scandir(uploads_path) as entries:
+        for entry in entries:
+            filename = entry.name
+
+            # Skip directories and hidden files
+            if filename.startswith('.') or entry.is_dir(follow_symlinks=False):
+                continue
+
+            file_path = entry.path
+            filename_lower = filename.lower()  # lowered once per entry
+
+            # Check if file has supported extension - rpartition reads
+            # the suffix without allocating a PurePath per entry
+            file_ext = '.' + filename_lower.rpartition('.')[2] if '.' in filename_lower else ''
+            if file_ext in supported_extensions:
+                if filename in processed_files:
+                    logger.info(f"  ✅ Already processed: {filename}")
+                elif processed_hashes and hash_file(file_path) in processed_hashes:
+                    # Same content under a new name - don't re-embed it
+                    logger.info(f"  ✅ Already processed (same content): {filename}")
+                else:
+                    files_found.append((file_path, filename))
+                    logger.info(f"  📄 Found (unprocessed): {filename}")
             else:
-                files_found.append((file_path, filename))
-                print(f"  📄 Found (unprocessed): {filename}")
-        else:
-            print(f"  ⚠️  Skipping unsupported file: {filename}")
+                logger.warning(f"  ⚠️  Skipping unsupported file: {filename}")
     
     return files_found
 
+async def scan_uploads_folder_async(uploads_path: str) -> List[Tuple[str, str]]:
+    """
+    Async wrapper around scan_uploads_folder for event-loop callers.
+
+    On network-mounted uploads (NFS, S3 fuse) every directory read and
+    content-hash check is a high-latency round trip; running the scan in
+    a worker thread keeps the event loop free instead of blocking it on
+    syscalls. The scan itself is already a single scandir pass.
+    """
+    import asyncio
+    return await asyncio.to_thread(scan_uploads_folder, uploads_path)
+
+@functools.lru_cache(maxsize=2)
+def _get_rag_system(embedding_dtype: str = "float32") -> InMemoryRAG:
+    """Construct the RAG system once per process; loading the persisted
+    caches is the expensive part, so repeat invocations reuse it"""
+    return InMemoryRAG(embedding_dtype=embedding_dtype)
+
+def extract_file_chunks(file_path: str, filename: str, category: str) -> list:
+    """
+    Extract chunks from a single file (no embedding - that happens later
+    in one batched pass across all files).
+
+    Args:
+        file_path: Full path to the file
+        filename: Name of the file
+        category: Category for the file
+
+    Returns:
+        List of (chunk, metadata) tuples, empty on failure
+    """
+    try:
+        logger.info(f"🔄 Extracting: {filename} (Category: {category})")
+        chunks = extract_chunks_from_file(file_path, filename, category)
+        if chunks:
+            logger.info(f"  📝 Extracted {len(chunks)} chunks")
+        else:
+            logger.warning(f"  ⚠️  No chunks extracted from {filename}")
+        return chunks
+    except Exception as e:
+        logger.error(f"  ❌ Error extracting {filename}: {e}")
+        return []
+
 def process_file(file_path: str, filename: str, category: str, rag_system: InMemoryRAG) -> bool:
     """
     Process a single file and add it to the knowledge base.
@@ -115,101 +197,174 @@ def process_file(file_path: str, filename: str, category: str, rag_system: InMem
         True if successful, False otherwise
     """
     try:
-        print(f"🔄 Processing: {filename} (Category: {category})")
+        logger.info(f"🔄 Processing: {filename} (Category: {category})")
         
         # Extract chunks from the file
         chunks = extract_chunks_from_file(file_path, filename, category)
         
         if not chunks:
-            print(f"  ⚠️  No chunks extracted from {filename}")
+            logger.warning(f"  ⚠️  No chunks extracted from {filename}")
             return False
         
-        print(f"  📝 Extracted {len(chunks)} chunks")
+        logger.info(f"  📝 Extracted {len(chunks)} chunks")
         
         # Store chunks in knowledge base
         doc_ids = store_embeddings_with_metadata(rag_system, chunks)
         
         if doc_ids:
-            print(f"  ✅ Successfully added {len(doc_ids)} chunks to knowledge base")
-            # Mark file as processed
-            mark_file_processed(filename)
+            logger.info(f"  ✅ Successfully added {len(doc_ids)} chunks to knowledge base")
+            # Mark file as processed (name + content hash)
+            mark_file_processed(filename, hash_file(file_path))
             return True
         else:
-            print(f"  ❌ Failed to add chunks to knowledge base")
+            logger.error(f"  ❌ Failed to add chunks to knowledge base")
             return False
             
     except Exception as e:
-        print(f"  ❌ Error processing {filename}: {e}")
+        logger.error(f"  ❌ Error processing {filename}: {e}")
         return False
 
 def process_uploads_folder(
     uploads_path: str = "uploads",
     custom_categories: Dict[str, str] = None,
-    dry_run: bool = False
+    dry_run: bool = False,
+    batch_size: int = 512,
+    workers: int = None,
+    embedding_dtype: str = "float32",
+    rag_system: InMemoryRAG = None
 ) -> Dict[str, int]:
     """
     Process all files in the uploads folder and add them to the knowledge base.
-    
+
     Args:
         uploads_path: Path to the uploads folder
         custom_categories: Custom category mapping
         dry_run: If True, only show what would be processed without actually doing it
-    
+        batch_size: Number of chunks per embedding request
+        workers: Extraction worker processes (default: cpu count)
+        embedding_dtype: In-memory vector dtype (float32, float16 or int8)
+        rag_system: Existing RAG instance to ingest into (default: shared one)
+
     Returns:
         Dictionary with processing statistics
     """
-    print("🚀 Starting uploads folder processing...")
-    print(f"📁 Uploads path: {uploads_path}")
-    print(f"🔧 Dry run: {dry_run}")
-    
-    # Initialize RAG system
+    logger.info("🚀 Starting uploads folder processing...")
+    logger.info(f"📁 Uploads path: {uploads_path}")
+    logger.info(f"🔧 Dry run: {dry_run}")
+
+    # Scan for files first - on a warm start everything is usually
+    # already processed, and then we never pay for RAG initialization
+    files_to_process = scan_uploads_folder(uploads_path)
+
+    if not files_to_process:
+        logger.info("ℹ️  No files found to process")
+        return {"processed": 0, "failed": 0, "skipped": 0}
+
+    # Initialize RAG system (memoized - repeat runs in the same process
+    # reuse the loaded instance)
     if not dry_run:
         try:
-            rag_system = InMemoryRAG()
-            print(f"✅ RAG system initialized")
-            print(f"📊 Current knowledge base size: {len(rag_system.knowledge_base)}")
+            if rag_system is None:
+                rag_system = _get_rag_system(embedding_dtype)
+            logger.info(f"✅ RAG system initialized")
+            logger.info(f"📊 Current knowledge base size: {len(rag_system.knowledge_base)}")
         except Exception as e:
-            print(f"❌ Failed to initialize RAG system: {e}")
+            logger.error(f"❌ Failed to initialize RAG system: {e}")
             return {"error": 1, "processed": 0, "failed": 0}
     else:
         rag_system = None
+
+    logger.info(f"\n📋 Found {len(files_to_process)} files to process")
     
-    # Scan for files
-    files_to_process = scan_uploads_folder(uploads_path)
-    
-    if not files_to_process:
-        print("ℹ️  No files found to process")
-        return {"processed": 0, "failed": 0, "skipped": 0}
-    
-    print(f"\n📋 Found {len(files_to_process)} files to process")
-    
-    # Process each file
+    # Process files in two stages: extract chunks from every file first,
+    # then embed everything in fixed-size batches. Embedding dominates
+    # runtime, so batching across files amortizes the API round trips
+    # instead of paying one small call per file.
     stats = {"processed": 0, "failed": 0, "skipped": 0}
-    
+
+    # Specialize categorization for this run's pattern set - one generated
+    # function call per file instead of the table walk in get_file_category
+    pattern_items = _DEFAULT_PATTERNS
+    if custom_categories:
+        pattern_items = tuple(custom_categories.items()) + pattern_items
+    categorize = _compile_category_dispatch(pattern_items)
+
+    jobs = []  # (file_path, filename, category)
     for file_path, filename in files_to_process:
         # Determine category
-        category = get_file_category(filename, custom_categories)
-        
+        category = categorize(filename)
         if dry_run:
-            print(f"🔍 Would process: {filename} → Category: {category}")
+            logger.info(f"🔍 Would process: {filename} → Category: {category}")
             stats["processed"] += 1
         else:
-            # Check if file is already processed (optional - can be enhanced)
-            success = process_file(file_path, filename, category, rag_system)
-            
-            if success:
+            jobs.append((file_path, filename, category))
+
+    # Pipeline extraction and embedding: files are parsed in worker
+    # processes (CPU-bound) while the main thread embeds completed files
+    # (network-bound), so the two stages overlap instead of running as
+    # strict phases. Chunks accumulate in a buffer flushed at batch_size,
+    # which bounds peak memory and keeps the embedding requests full.
+    buffer = []
+    buffered_files = []  # files whose chunks are all in buffer
+
+    def flush_buffer():
+        """Embed and store everything buffered, then mark its files"""
+        if not buffer:
+            return
+        # Contain embedding failures (auth errors, rate limits, network
+        # blips) the same way extract_file_chunks contains extraction
+        # failures: count the buffered files as failed and keep going.
+        # app.py calls us at startup, so a transient API error must not
+        # abort server boot.
+        try:
+            doc_ids = store_embeddings_batched(rag_system, buffer, batch_size=batch_size)
+        except Exception as e:
+            logger.error(f"  ❌ Error embedding batch of {len(buffer)} chunks: {e}")
+            doc_ids = None
+        if doc_ids:
+            for buffered_path, buffered_name in buffered_files:
+                mark_file_processed(buffered_name, hash_file(buffered_path))
                 stats["processed"] += 1
-            else:
-                stats["failed"] += 1
-    
+        else:
+            stats["failed"] += len(buffered_files)
+        buffer.clear()
+        buffered_files.clear()
+
+    def consume(file_path, filename, chunks):
+        if not chunks:
+            stats["failed"] += 1
+            return
+        buffer.extend(chunks)
+        buffered_files.append((file_path, filename))
+        if len(buffer) >= batch_size:
+            flush_buffer()
+
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            future_jobs = {pool.submit(extract_file_chunks, *job): job for job in jobs}
+            for future in as_completed(future_jobs):
+                file_path, filename, _ = future_jobs[future]
+                consume(file_path, filename, future.result())
+    else:
+        for file_path, filename, category in jobs:
+            consume(file_path, filename, extract_file_chunks(file_path, filename, category))
+
+    flush_buffer()
+
+    # Each mark already appended to the tracker log synchronously; this
+    # is just the safety-valve flush of anything still buffered
+    flush_processed_files()
+    if rag_system is not None:
+        rag_system.flush_if_dirty()
+
     # Print final statistics
-    print(f"\n📊 Processing Summary:")
-    print(f"  ✅ Processed: {stats['processed']}")
-    print(f"  ❌ Failed: {stats['failed']}")
-    print(f"  ⏭️  Skipped: {stats.get('skipped', 0)}")
+    logger.info(f"\n📊 Processing Summary:")
+    logger.info(f"  ✅ Processed: {stats['processed']}")
+    logger.info(f"  ❌ Failed: {stats['failed']}")
+    logger.info(f"  ⏭️  Skipped: {stats.get('skipped', 0)}")
     
     if not dry_run and rag_system:
-        print(f"📈 Final knowledge base size: {len(rag_system.knowledge_base)}")
+        logger.info(f"📈 Final knowledge base size: {len(rag_system.knowledge_base)}")
     
     return stats
 
@@ -221,11 +376,34 @@ def main():
         default="uploads", 
         help="Path to uploads folder (default: uploads)"
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=512,
+        help="Number of chunks per embedding request (default: 512)"
+    )
+    parser.add_argument(
+        "--embedding-dtype",
+        choices=["float32", "float16", "int8"],
+        default="float32",
+        help="In-memory vector dtype; float16 halves search-matrix RAM (default: float32)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Extraction worker processes (default: cpu count)"
+    )
     parser.add_argument(
         "--dry-run", 
         action="store_true", 
         help="Show what would be processed without actually doing it"
     )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only log warnings and errors"
+    )
     parser.add_argument(
         "--category", 
         action="append", 
@@ -235,6 +413,14 @@ def main():
     )
     
     args = parser.parse_args()
+
+    # One buffered stderr handler instead of per-line stdout flushes; the
+    # level gate means --quiet skips the formatting work entirely
+    logging.basicConfig(
+        level=logging.WARNING if args.quiet else logging.INFO,
+        format='%(message)s',
+        stream=sys.stderr
+    )
     
     # Build custom categories dictionary
     custom_categories = {}
@@ -246,7 +432,10 @@ def main():
     stats = process_uploads_folder(
         uploads_path=args.uploads_path,
         custom_categories=custom_categories,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        embedding_dtype=args.embedding_dtype
     )
     
     # Exit with appropriate code
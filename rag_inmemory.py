@@ -1,22 +1,217 @@
+import atexit
+import hashlib
 import os
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import time
+from dataclasses import dataclass, field
 from typing import List, Dict, Optional, Tuple
-import uuid
 import json
 import pickle
+import threading
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from search_kernels import topk_filtered
+from embedding_cache import text_hash, get_cached_many, put_cached_many
 from consultation_engine import ConsultationEngine
 import re
 from openai import OpenAI
 
+# Optional: FAISS does the unfiltered top-k scan as a fused C++ GEMM +
+# heap select. The NumPy path below stays as the fallback.
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Optional: SimSIMD dispatches cosine distance to AVX-512/NEON kernels
+# and fuses the per-row normalization into the scan
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# orjson serializes the context write-ahead log lines 2-5x faster than
+# stdlib json; same guarded fallback as the Flask JSON provider
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _ndarray_default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, default=_ndarray_default).encode()
+
+    _json_loads = json.loads
+
 # Load environment variables
 load_dotenv()
 
+"""Time-ordered id: nanosecond timestamp prefix + 8 random bytes, hex.
+k-sortable like a ULID (ids created later sort later), cheaper than
+uuid4's five-field string formatting, and insertion order stays
+monotonic in the id column."""
+def _new_id() -> str:
+    return f"{time.time_ns():016x}{os.urandom(8).hex()}"
+
+"""16-byte BLAKE2b digest of chunk text - the dedup identity (same
+hash and truncation the embedding LRU uses for its keys)"""
+def _content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+# Embeddings endpoint limits: ~2048 inputs and ~300K tokens per request.
+# Tokens are estimated as chars/4 (close enough for packing; staying a
+# third under the real cap absorbs the estimate's error).
+_EMBED_MAX_INPUTS = 2048
+_EMBED_MAX_TOKENS = 200_000
+_EMBED_MAX_INFLIGHT = 8
+
+# Compact the context write-ahead log into the pickle snapshot after
+# this many appended turns
+_CTX_COMPACT_EVERY = 100
+
+# Sentinel for "key absent from this item's metadata" in the columnar
+# metadata index; compares unequal to every real value
+_META_MISSING = object()
+
+# Compiled once at import - _format_numbered_lists runs on every
+# assistant response, so don't rebuild the patterns (or a closure) there
+_NUM_LIST_RE = re.compile(r'(\d+\.\s+[^1-9]*?)(?=\d+\.|$)')
+_NUM_PAREN_RE = re.compile(r'(\d+\)\s+[^1-9]*?)(?=\d+\)|$)')
+
+"""Rewrite one matched list item onto its own line"""
+def _replace_list_item(match):
+    return match.group(1).strip() + '\n'
+
+# Mode-selection keywords, matched as whole tokens. Substring scans both
+# cost O(len(input) * keywords) and misfire ("assess" inside unrelated
+# words); one findall + two hashed intersections replaces them.
+_WORD_RE = re.compile(r'\w+')
+_CONSULT_KWS = frozenset({
+    'consultation', 'consult', 'assess', 'assessment', 'test', 'level',
+    'recommend', 'recommendation',
+})
+_FAQ_KWS = frozenset({
+    'question', 'questions', 'faq', 'info', 'about', 'price', 'prices',
+    'pricing', 'teacher', 'teachers',
+})
+
+"""Append rows to a geometrically grown buffer, returning the buffer"""
+def _grow_append(buf: Optional[np.ndarray], new_part: np.ndarray, rows: int) -> np.ndarray:
+    needed = rows + new_part.shape[0]
+    if buf is None:
+        cap = max(needed, 256)
+        buf = np.empty((cap,) + new_part.shape[1:], dtype=new_part.dtype)
+    elif needed > buf.shape[0]:
+        cap = max(needed, 2 * buf.shape[0])
+        bigger = np.empty((cap,) + buf.shape[1:], dtype=buf.dtype)
+        bigger[:rows] = buf[:rows]
+        buf = bigger
+    buf[rows:needed] = new_part
+    return buf
+
+"""L2-normalize rows in place; stored vectors are immutable, so paying
+the sqrt once at insert turns every search into a pure dot product"""
+def _normalize_rows(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0  # leave all-zero rows untouched
+    rows /= norms
+    return rows
+
+"""Quantize float32 rows to int8 with one symmetric scale per row"""
+def _quantize_rows(rows: np.ndarray):
+    scales = np.max(np.abs(rows), axis=1) / 127.0
+    scales[scales == 0] = 1.0  # all-zero rows quantize to zeros
+    quantized = np.round(rows / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+@dataclass
+class KnowledgeStore:
+    """Struct-of-arrays store for the searchable embedding columns.
+
+    Every similarity scan touches only contiguous arrays here - vectors,
+    norms, int8 scales, category codes - while the per-item metadata
+    stays in InMemoryRAG.knowledge_base (list of dicts, the shape the
+    rest of the app consumes); row i of the store belongs to item i.
+    Backing buffers grow geometrically, so appending a batch is an
+    amortized O(batch) copy, and the public attributes are row-count
+    views of them.
+    """
+    dtype: str = "float32"
+    matrix: Optional[np.ndarray] = None
+    norms: Optional[np.ndarray] = None
+    scales: Optional[np.ndarray] = None   # per-row scale, int8 mode only
+    cat_codes: Optional[np.ndarray] = None
+    rows: int = 0
+    _buf: Optional[np.ndarray] = field(default=None, repr=False)
+    _norms_buf: Optional[np.ndarray] = field(default=None, repr=False)
+    _scales_buf: Optional[np.ndarray] = field(default=None, repr=False)
+    _codes_buf: Optional[np.ndarray] = field(default=None, repr=False)
+
+    """Normalize, downcast/quantize and append a batch of raw float32 rows"""
+    def append_batch(self, raw_rows: np.ndarray, codes: np.ndarray):
+        new_rows = _normalize_rows(np.array(raw_rows, dtype=np.float32))
+        new_norms = np.ones(new_rows.shape[0], dtype=np.float32)
+        new_scales = None
+        if self.dtype == "int8":
+            new_rows, new_scales = _quantize_rows(new_rows)
+        elif self.dtype == "float16":
+            new_rows = new_rows.astype(np.float16)
+
+        n = self.rows
+        self._buf = _grow_append(self._buf, new_rows, n)
+        self._norms_buf = _grow_append(self._norms_buf, new_norms, n)
+        self._codes_buf = _grow_append(self._codes_buf, codes, n)
+        if new_scales is not None:
+            self._scales_buf = _grow_append(self._scales_buf, new_scales, n)
+        self.rows = n + new_rows.shape[0]
+        self._refresh()
+
+    """Drop all rows and release the buffers"""
+    def clear(self):
+        self._buf = None
+        self._norms_buf = None
+        self._scales_buf = None
+        self._codes_buf = None
+        self.rows = 0
+        self._refresh()
+
+    """Refresh the public matrix/norm/scale/code views of the buffers"""
+    def _refresh(self):
+        n = self.rows
+        if n == 0:
+            self.matrix = None
+            self.norms = None
+            self.scales = None
+            self.cat_codes = None
+            return
+        self.matrix = self._buf[:n]
+        self.norms = self._norms_buf[:n]
+        self.scales = self._scales_buf[:n] if self._scales_buf is not None else None
+        self.cat_codes = self._codes_buf[:n]
+
+
 class InMemoryRAG:
     """Initialize In-Memory RAG system"""
-    def __init__(self, persist_directory: str = "./vector_cache"):
-        
+    def __init__(self, persist_directory: str = "./vector_cache", embedding_dtype: str = "float32"):
+
+        if embedding_dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported embedding_dtype: {embedding_dtype}")
+        # 'float16' halves the search-matrix RAM and memory bandwidth with
+        # near-identical cosine ranking; 'int8' stores quantized vectors +
+        # one scale per row for a 4x reduction at <1% recall loss
+        self.embedding_dtype = embedding_dtype
+
         # Get OpenAI API key from environment
         openai_api_key = os.getenv("OPENAI_API_KEY")
 
@@ -29,11 +224,96 @@ class InMemoryRAG:
         # Storage for knowledge base and context
         self.knowledge_base: List[Dict] = []  # List of {id, content, metadata, embedding}
         self.context_base: List[Dict] = []    # List of conversation contexts
-        
-        # File paths for persistence
+
+        # session_id -> context_base row numbers, so per-session retrieval
+        # is one dict lookup instead of scanning every session's history
+        self._ctx_by_session: Dict[str, List[int]] = {}
+
+        # Contiguous normalized float32 matrix of context embeddings (row
+        # i belongs to context_base[i]), grown geometrically like the
+        # knowledge matrix; retrieval is a gather + one dot product
+        self._ctx_buf: Optional[np.ndarray] = None
+        self._ctx_matrix: Optional[np.ndarray] = None
+        self._ctx_rows = 0
+
+        # Guards knowledge_base mutation when files are ingested concurrently
+        self._kb_lock = threading.Lock()
+
+        # LRU of recent embeddings keyed by text hash. A chat turn embeds
+        # the same user input for context lookup and knowledge search;
+        # the second lookup is a dict hit instead of an HTTPS round trip.
+        self._embed_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._embed_cache_max = 4096
+        self._embed_cache_lock = threading.Lock()
+
+        # Inserts only mark the store dirty; flush() rewrites the pickles
+        # once per batch instead of once per insert (O(N) vs O(N^2) I/O
+        # over a bulk load). atexit covers whatever is still unflushed.
+        self._dirty = False
+        atexit.register(self.flush_if_dirty)
+
+        # Struct-of-arrays store for the searchable columns (contiguous
+        # embedding matrix, norms, int8 scales, category codes); row i
+        # matches knowledge_base[i], which keeps the per-item metadata
+        self._kb = KnowledgeStore(dtype=embedding_dtype)
+        self._cat_code_of: Dict[str, int] = {}
+
+        # Inverted index: category -> matrix row numbers, so a category
+        # filter is one dict lookup + fancy-index instead of a Python
+        # loop over every item
+        self._rows_by_category: Dict[str, List[int]] = {}
+
+        # Columnar metadata (key -> per-row object array) for vectorized
+        # metadata-only filtering; rebuilt lazily after inserts
+        self._meta_cols: Dict[str, np.ndarray] = {}
+        self._meta_rows = 0
+
+        # Inverted metadata index: key -> value -> compact row-number
+        # postings, so an exact-match filter costs its result size
+        # rather than a knowledge-base scan
+        self._meta_index: Dict[str, Dict] = {}
+
+        # BLAKE2b digests of stored chunk texts, so ingest can skip
+        # re-embedding and re-inserting exact-duplicate chunks
+        self._content_hashes: set = set()
+
+        # Bumped on every insert, clear and reload; caches keyed on it
+        # go stale automatically without being scanned or purged
+        self._insert_generation = 0
+
+        # Category/type tallies maintained at insert time, so stats reads
+        # never rescan the knowledge base
+        self._category_counts: Counter = Counter()
+        self._type_counts: Counter = Counter()
+
+        # Optional FAISS inner-product index over L2-normalized rows,
+        # synced lazily from the matrix on first search after an append
+        self._faiss_index = None
+        
+        # File paths for persistence. Knowledge is split: small metadata
+        # records in one file, embeddings as a raw float32 matrix that is
+        # memmapped on load (no per-float unpickling) and appended to on
+        # flush. knowledge_base.pkl is the pre-split legacy format.
         self.persist_directory = persist_directory
         self.knowledge_file = os.path.join(persist_directory, "knowledge_base.pkl")
+        # Metadata is JSON (orjson when installed): faster to decode than
+        # unpickling, safe to load, and inspectable with standard tools.
+        # knowledge_meta.pkl is the interim pickled-metadata format.
+        self.knowledge_meta_file = os.path.join(persist_directory, "knowledge_meta.json")
+        self._knowledge_meta_pickle = os.path.join(persist_directory, "knowledge_meta.pkl")
+        self.knowledge_emb_file = os.path.join(persist_directory, "knowledge_emb.f32")
         self.context_file = os.path.join(persist_directory, "context_base.pkl")
+
+        # Context turns are appended to a write-ahead log (one small write
+        # per turn) and folded into the pickle snapshot at compaction
+        self.context_wal_file = os.path.join(persist_directory, "context_wal.jsonl")
+        self._ctx_wal_fh = None
+        self._ctx_wal_appends = 0
+
+        # Rows already written to the embedding file, plus the raw float32
+        # rows inserted since the last flush; flush appends only the latter
+        self._kb_flushed = 0
+        self._pending_rows: List[np.ndarray] = []
         
         # Create persist directory if it doesn't exist
         os.makedirs(persist_directory, exist_ok=True)
@@ -47,10 +327,14 @@ class InMemoryRAG:
         
         # ? Categories - TBD
         self.categories = ["Curriculum", "Pricing", "Teachers", "Textbooks", "About Us", "Contact", "Other"]
+
+        # Categories are immutable post-init, so the base system prompt is
+        # rendered once here; response generation reuses the string
+        self._base_system_prompt = self._render_base_system_prompt()
         
         # Conversation state
         self.conversation_history: List[Dict] = []
-        self.current_session_id = str(uuid.uuid4())
+        self.current_session_id = _new_id()
         self.active_procedures: Dict[str, Dict] = {}
         
         # Dynamic device attributes
@@ -64,14 +348,53 @@ class InMemoryRAG:
 
     """Load persisted knowledge and context from files"""
     def load_persisted_data(self):
+        kb_rows = None
+        # Loading replaces the in-memory state wholesale, so rows queued
+        # before the load (e.g. unflushed inserts when a backup is
+        # restored onto a live instance) must not survive it - a later
+        # flush would append them to the restored embedding file and trip
+        # the mismatch guard. The legacy branch below repopulates
+        # _pending_rows on purpose, after this reset.
+        self._pending_rows = []
+        self._dirty = False
         try:
-            if os.path.exists(self.knowledge_file):
+            meta = None
+            if os.path.exists(self.knowledge_meta_file):
+                with open(self.knowledge_meta_file, 'rb') as f:
+                    meta = _json_loads(f.read())
+            elif os.path.exists(self._knowledge_meta_pickle):
+                with open(self._knowledge_meta_pickle, 'rb') as f:
+                    meta = pickle.load(f)
+            if meta is not None:
+                if meta:
+                    # One bulk read of the raw matrix instead of
+                    # re-materializing every float as a Python object
+                    emb = np.fromfile(self.knowledge_emb_file, dtype=np.float32)
+                    dim = emb.size // len(meta)
+                    if dim == 0 or dim * len(meta) != emb.size:
+                        raise ValueError("embedding file does not match metadata")
+                    kb_rows = emb.reshape(len(meta), dim)
+                self.knowledge_base = meta
+                self._kb_flushed = len(meta)
+                print(f"✅ Loaded {len(self.knowledge_base)} items from knowledge cache")
+            elif os.path.exists(self.knowledge_file):
+                # Legacy single-pickle format with embeddings inline; pull
+                # them out as pending rows so the next flush writes split
                 with open(self.knowledge_file, 'rb') as f:
                     self.knowledge_base = pickle.load(f)
-                print(f"✅ Loaded {len(self.knowledge_base)} items from knowledge cache")
+                self._pending_rows = [
+                    np.asarray(item.pop('embedding'), dtype=np.float32)
+                    for item in self.knowledge_base if 'embedding' in item
+                ]
+                if self._pending_rows:
+                    kb_rows = np.asarray(self._pending_rows)
+                print(f"✅ Loaded {len(self.knowledge_base)} items from knowledge cache (legacy format)")
         except Exception as e:
             print(f"⚠️  Could not load knowledge cache: {e}")
             self.knowledge_base = []
+            self._kb_flushed = 0
+            self._pending_rows = []
+            kb_rows = None
         
         try:
             if os.path.exists(self.context_file):
@@ -81,23 +404,222 @@ class InMemoryRAG:
         except Exception as e:
             print(f"⚠️  Could not load context cache: {e}")
             self.context_base = []
-    
+
+        # Replay context turns written after the last snapshot
+        try:
+            if os.path.exists(self.context_wal_file):
+                with open(self.context_wal_file, 'rb') as f:
+                    replayed = 0
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            self.context_base.append(_json_loads(line))
+                            replayed += 1
+                if replayed:
+                    print(f"✅ Replayed {replayed} context turns from the write-ahead log")
+        except Exception as e:
+            print(f"⚠️  Could not replay context log: {e}")
+
+        self._rebuild_kb_matrix(kb_rows)
+        self._rebuild_ctx_index()
+        self._rebuild_ctx_matrix()
+
+    """Rebuild the session_id -> context row index from context_base"""
+    def _rebuild_ctx_index(self):
+        self._ctx_by_session = {}
+        for idx, ctx in enumerate(self.context_base):
+            session_id = ctx.get("session_id")
+            if session_id is not None:
+                self._ctx_by_session.setdefault(session_id, []).append(idx)
+
+    """Rebuild the contiguous context-embedding matrix from context_base"""
+    def _rebuild_ctx_matrix(self):
+        self._ctx_buf = None
+        self._ctx_matrix = None
+        self._ctx_rows = 0
+        embeddings = [ctx.get('embedding') for ctx in self.context_base]
+        dim = next((len(e) for e in embeddings if e is not None), None)
+        if dim is None:
+            return
+        # Entries without an embedding (old data) get a zero row, which
+        # scores 0 and keeps row numbers aligned with context_base
+        zero = np.zeros(dim, dtype=np.float32)
+        rows = np.asarray([e if e is not None else zero for e in embeddings],
+                          dtype=np.float32)
+        self._ctx_buf = _normalize_rows(rows)
+        self._ctx_rows = rows.shape[0]
+        self._ctx_matrix = self._ctx_buf[:self._ctx_rows]
+
+    """Append one normalized context embedding row (geometric growth)"""
+    def _append_ctx_row(self, embedding):
+        row = _normalize_rows(
+            np.asarray(embedding, dtype=np.float32).reshape(1, -1).copy())
+        self._ctx_buf = _grow_append(self._ctx_buf, row, self._ctx_rows)
+        self._ctx_rows += 1
+        self._ctx_matrix = self._ctx_buf[:self._ctx_rows]
+
+    """Bring the FAISS index up to date with the matrix, appending only
+    the rows added since the last sync (rows are append-only)"""
+    def _faiss_sync(self):
+        if self._faiss_index is None:
+            self._faiss_index = faiss.IndexFlatIP(self._kb.matrix.shape[1])
+        start = self._faiss_index.ntotal
+        if start < self._kb.rows:
+            # Rows are normalized at insert, so they can be added as-is
+            self._faiss_index.add(self._kb.matrix[start:self._kb.rows])
+        return self._faiss_index
+
+    """Rebuild the knowledge store from a (N, D) row array
+    (row i belongs to knowledge_base[i])"""
+    def _rebuild_kb_matrix(self, kb_rows: Optional[np.ndarray] = None):
+        self._faiss_index = None  # re-synced lazily from the new matrix
+        self._rows_by_category.clear()
+        self._invalidate_metadata_caches()
+        self._insert_generation += 1
+        self._content_hashes = {
+            _content_hash(item['content']) for item in self.knowledge_base}
+        self._kb.clear()
+        if kb_rows is None or len(kb_rows) == 0:
+            return
+        codes = self._cat_codes_for(
+            [item.get('metadata', {}) for item in self.knowledge_base], 0)
+        self._kb.append_batch(kb_rows, codes)
+
+    """Map metadata categories to integer codes, registering new ones and
+    recording each row in the per-category inverted index"""
+    def _cat_codes_for(self, metadatas: List[Dict], start_row: int) -> np.ndarray:
+        codes = np.empty(len(metadatas), dtype=np.int32)
+        for i, metadata in enumerate(metadatas):
+            metadata = metadata or {}
+            self._category_counts[metadata.get('category', 'Unknown')] += 1
+            self._type_counts[metadata.get('type', 'Unknown')] += 1
+            for key, value in metadata.items():
+                try:
+                    by_value = self._meta_index.setdefault(key, {})
+                    postings = by_value.setdefault(value, array('i'))
+                except TypeError:
+                    continue  # unhashable value (e.g. a list) - not indexed
+                postings.append(start_row + i)
+            category = metadata.get('category')
+            if category is None:
+                codes[i] = -1
+            else:
+                code = self._cat_code_of.get(category)
+                if code is None:
+                    code = len(self._cat_code_of)
+                    self._cat_code_of[category] = code
+                codes[i] = code
+                self._rows_by_category.setdefault(category, []).append(start_row + i)
+        return codes
+
+    """Append new embedding rows to the store (callers hold _kb_lock)"""
+    def _append_kb_rows(self, embeddings: List, metadatas: List[Dict]):
+        codes = self._cat_codes_for(metadatas, self._kb.rows)
+        self._kb.append_batch(np.asarray(embeddings, dtype=np.float32), codes)
+
+    """Reset every cache derived from item metadata - counters, inverted
+    index, columnar view - in one place, so clears and rebuilds can't
+    leave one of them stale (the columnar view in particular could
+    otherwise survive a reload that kept the same item count)"""
+    def _invalidate_metadata_caches(self):
+        self._category_counts.clear()
+        self._type_counts.clear()
+        self._meta_index.clear()
+        self._meta_cols = {}
+        self._meta_rows = -1  # force the lazy column rebuild
+
+    """Columnar view of item metadata: one object array per key, row i
+    matching knowledge_base[i]. Filters compare whole columns in C
+    instead of walking every item's dict; rebuilt lazily once per
+    insert epoch (the knowledge base is append-only between clears)."""
+    def _metadata_columns(self) -> Dict[str, np.ndarray]:
+        n = len(self.knowledge_base)
+        if self._meta_rows != n:
+            cols: Dict[str, np.ndarray] = {}
+            for i, item in enumerate(self.knowledge_base):
+                for key, value in (item.get('metadata') or {}).items():
+                    col = cols.get(key)
+                    if col is None:
+                        col = np.full(n, _META_MISSING, dtype=object)
+                        cols[key] = col
+                    col[i] = value
+            self._meta_cols = cols
+            self._meta_rows = n
+        return self._meta_cols
+
     """Save knowledge and context to files for persistence"""
     def save_persisted_data(self):
         try:
-            with open(self.knowledge_file, 'wb') as f:
-                pickle.dump(self.knowledge_base, f)
-            print(f"✅ Saved {len(self.knowledge_base)} items to knowledge cache")
+            # The lock keeps the snapshot atomic with respect to inserts
+            # (and serializes concurrent flushes): a row appended between
+            # the metadata dump and the pending-row drain would otherwise
+            # vanish, leaving the embedding file shorter than the
+            # metadata and tripping the mismatch guard on next startup
+            with self._kb_lock:
+                with open(self.knowledge_meta_file, 'wb') as f:
+                    f.write(_json_dumps(self.knowledge_base))
+
+                n = len(self.knowledge_base)
+                if self._kb_flushed > n:
+                    # Shrunk - only a clear does this; start the file over
+                    self._kb_flushed = 0
+                append = self._kb_flushed and os.path.exists(self.knowledge_emb_file)
+                if self._pending_rows or not append:
+                    with open(self.knowledge_emb_file, 'ab' if append else 'wb') as f:
+                        np.asarray(self._pending_rows, dtype=np.float32).tofile(f)
+                self._kb_flushed = n
+                self._pending_rows = []
+            print(f"✅ Saved {n} items to knowledge cache")
         except Exception as e:
             print(f"❌ Could not save knowledge cache: {e}")
         
         try:
             with open(self.context_file, 'wb') as f:
                 pickle.dump(self.context_base, f)
+            # The snapshot now covers everything in the log
+            self._truncate_context_wal()
             print(f"✅ Saved {len(self.context_base)} items to context cache")
         except Exception as e:
             print(f"❌ Could not save context cache: {e}")
-    
+        self._dirty = False
+
+    """Append one context turn to the write-ahead log - O(1) per turn
+    instead of re-pickling the whole context base - and compact the log
+    into the snapshot every _CTX_COMPACT_EVERY turns"""
+    def _append_context_wal(self, entry: Dict):
+        try:
+            if self._ctx_wal_fh is None:
+                self._ctx_wal_fh = open(self.context_wal_file, 'ab')
+            self._ctx_wal_fh.write(_json_dumps(entry) + b'\n')
+            self._ctx_wal_fh.flush()
+            self._ctx_wal_appends += 1
+        except Exception as e:
+            print(f"⚠️  Could not append to context log: {e}")
+            return
+        if self._ctx_wal_appends >= _CTX_COMPACT_EVERY:
+            self.save_persisted_data()
+
+    """Drop the write-ahead log after its turns reach the snapshot"""
+    def _truncate_context_wal(self):
+        self._ctx_wal_appends = 0
+        if self._ctx_wal_fh is not None:
+            self._ctx_wal_fh.close()
+            self._ctx_wal_fh = None
+        try:
+            os.remove(self.context_wal_file)
+        except OSError:
+            pass
+
+    """Persist knowledge and context to disk and clear the dirty flag"""
+    def flush(self):
+        self.save_persisted_data()
+
+    """Flush to disk only if inserts happened since the last flush"""
+    def flush_if_dirty(self):
+        if self._dirty:
+            self.flush()
+
+
     def get_categories(self) -> List[str]:
         """Get all available information categories"""
         return list(self.categories)
@@ -112,39 +634,74 @@ class InMemoryRAG:
     '''
     
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings from OpenAI API"""
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
-        )
-        return [embedding.embedding for embedding in response.data]
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings from OpenAI API (recent texts served from an LRU).
+
+        Returns a (B, D) float32 array - rows instead of Python lists of
+        floats, so downstream code slices views rather than re-converting.
+        """
+        keys = [hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts]
+        with self._embed_cache_lock:
+            embeddings = []
+            for key in keys:
+                hit = self._embed_cache.get(key)
+                if hit is not None:
+                    self._embed_cache.move_to_end(key)
+                embeddings.append(hit)
+
+        miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+        if miss_indices:
+            new_embeddings = self._batched_embeddings([texts[i] for i in miss_indices])
+            with self._embed_cache_lock:
+                for i, emb in zip(miss_indices, new_embeddings):
+                    embeddings[i] = emb
+                    self._embed_cache[keys[i]] = emb
+                while len(self._embed_cache) > self._embed_cache_max:
+                    self._embed_cache.popitem(last=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _batched_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts in request-size-aware batches, in input order.
+
+        Inputs are packed greedily under both endpoint caps; a single
+        oversized request would be rejected outright. Multiple batches go
+        out concurrently - the calls are network-bound, so overlapping
+        them hides most of the per-request latency.
+        """
+        bounds = []
+        start = 0
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            estimate = len(text) // 4 + 1
+            if i > start and (i - start >= _EMBED_MAX_INPUTS
+                              or batch_tokens + estimate > _EMBED_MAX_TOKENS):
+                bounds.append((start, i))
+                start = i
+                batch_tokens = 0
+            batch_tokens += estimate
+        bounds.append((start, len(texts)))
+
+        def embed(span):
+            response = self.openai_client.embeddings.create(
+                model="text-embedding-3-small",
+                input=texts[span[0]:span[1]]
+            )
+            return [np.asarray(item.embedding, dtype=np.float32) for item in response.data]
+
+        if len(bounds) == 1:
+            return embed(bounds[0])
+        with ThreadPoolExecutor(max_workers=min(_EMBED_MAX_INFLIGHT, len(bounds))) as pool:
+            return [emb for batch in pool.map(embed, bounds) for emb in batch]
     
 
     def add_knowledge(self, content: str, metadata: Dict = None) -> str:
         """Add content to knowledge base with embeddings"""
         if not content or not content.strip():
             raise ValueError("Content cannot be empty")
-        
-        doc_id = str(uuid.uuid4())
-        
-        # Get embedding for the content
-        embedding = self.get_embeddings([content])[0]
-        
-        # Create knowledge item
-        knowledge_item = {
-            'id': doc_id,
-            'content': content,
-            'metadata': metadata or {},
-            'embedding': embedding,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        self.knowledge_base.append(knowledge_item)
-        
-        # Save to disk
-        self.save_persisted_data()
-        return doc_id
+
+        # Funnel through the batch path so every insert shares the single
+        # embeddings.create call (one HTTPS round-trip per batch)
+        return self.add_knowledge_batch([(content, metadata or {})])[0]
 
     
     def add_knowledge_batch(self, content_tuples: List[Tuple[str, Dict]]):
@@ -159,47 +716,121 @@ class InMemoryRAG:
         if not contents:
             return []
         
-        # Get embeddings for all content at once
-        embeddings = self.get_embeddings(contents)
-        
+        # Get embeddings for all content at once (outside the lock - this is
+        # the slow network call). Chunks seen before are served from the
+        # content-hash cache, so re-ingesting an edited file only embeds
+        # the chunks that actually changed.
+        hashes = [text_hash(content) for content in contents]
+        cached = get_cached_many(hashes)
+        embeddings = [cached.get(h) for h in hashes]
+
+        miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+        if miss_indices:
+            new_embeddings = self.get_embeddings([contents[i] for i in miss_indices])
+            put_cached_many([(hashes[i], emb) for i, emb in zip(miss_indices, new_embeddings)])
+            for i, emb in zip(miss_indices, new_embeddings):
+                embeddings[i] = emb
+
         doc_ids = []
-        for content, metadata, embedding in zip(contents, metadatas, embeddings):
-            doc_id = str(uuid.uuid4())
-            
-            knowledge_item = {
-                'id': doc_id,
-                'content': content,
-                'metadata': metadata or {},
-                'embedding': embedding,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self.knowledge_base.append(knowledge_item)
-            doc_ids.append(doc_id)
-        
-        # Save to disk
-        self.save_persisted_data()
+        with self._kb_lock:
+            for content, metadata in zip(contents, metadatas):
+                doc_id = _new_id()
+
+                # No 'embedding' field - vectors live only in the matrix
+                # (row i belongs to knowledge_base[i]), which cuts ~43KB
+                # of Python float objects per item down to 6KB of float32
+                knowledge_item = {
+                    'id': doc_id,
+                    'content': content,
+                    'metadata': metadata or {},
+                    'timestamp': datetime.now().isoformat()
+                }
+
+                self.knowledge_base.append(knowledge_item)
+                self._content_hashes.add(_content_hash(content))
+                doc_ids.append(doc_id)
+
+            self._append_kb_rows(embeddings, metadatas)
+            self._insert_generation += 1
+            self._pending_rows.extend(
+                np.asarray(embedding, dtype=np.float32) for embedding in embeddings)
+
+            # Deferred persistence - the ingest driver flushes per batch
+            self._dirty = True
         print(f"✅ Added {len(doc_ids)} items to knowledge base")
         
         return doc_ids
     
 
-    def search_knowledge_base(self, query: str, limit: int = 5, filters: Dict = None) -> List[Dict]:
+    def search_knowledge_base(self, query: str, limit: int = 5, filters: Dict = None,
+                              query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Search the knowledge base using cosine similarity"""
-        if not self.knowledge_base:
+        if not self.knowledge_base or self._kb.matrix is None:
             return []
-        
-        # Get query embedding
-        query_embedding = self.get_embeddings([query])[0]
-        
-        # Apply filters if provided
-        filtered_items = self.knowledge_base
-        if filters:
-            filtered_items = []
-            for item in self.knowledge_base:
+
+        # Get query embedding unless the caller already has it
+        if query_embedding is None:
+            query_embedding = self.get_embeddings([query])[0]
+
+        # Fast path: unfiltered float32 searches go through FAISS when it's
+        # installed - fused GEMM + top-k heap in C++, no Python sort
+        if not filters and faiss is not None and self.embedding_dtype == "float32":
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q_norm = float(np.linalg.norm(q))
+            if q_norm == 0:
+                return []
+            with self._kb_lock:
+                index = self._faiss_sync()
+            sims, rows = index.search((q / q_norm).reshape(1, -1), min(limit, self._kb.rows))
+            results = []
+            for row, similarity in zip(rows[0], sims[0]):
+                item = self.knowledge_base[int(row)]
+                results.append({
+                    'content': item['content'],
+                    'metadata': item['metadata'],
+                    'relevance': float(similarity),
+                    'id': item['id']
+                })
+            return results
+
+        # Fast path: a plain single-category filter goes through the fused
+        # scan kernel - no Python filter loop, no gathered matrix copy
+        if (filters and len(filters) == 1 and isinstance(filters.get('category'), str)
+                and self.embedding_dtype == "float32" and self._kb.cat_codes is not None):
+            cat_id = self._cat_code_of.get(filters['category'])
+            if cat_id is None:
+                return []
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q_norm = float(np.linalg.norm(q))
+            if q_norm == 0:
+                return []
+            top, sims = topk_filtered(self._kb.matrix, self._kb.norms,
+                                      self._kb.cat_codes, q, q_norm, cat_id, limit)
+            results = []
+            for row, similarity in zip(top, sims):
+                item = self.knowledge_base[int(row)]
+                results.append({
+                    'content': item['content'],
+                    'metadata': item['metadata'],
+                    'relevance': float(similarity),
+                    'id': item['id']
+                })
+            return results
+
+        # Apply filters if provided (row indices into the matrix). A plain
+        # category filter comes straight from the inverted index - no
+        # Python loop over the knowledge base.
+        indices = None
+        if filters and len(filters) == 1 and isinstance(filters.get('category'), str):
+            indices = self._rows_by_category.get(filters['category'])
+            if not indices:
+                return []
+        elif filters:
+            indices = []
+            for row, item in enumerate(self.knowledge_base):
                 metadata = item.get('metadata', {})
                 match = True
-                
+
                 # Check each filter
                 for key, value in filters.items():
                     if key in metadata:
@@ -214,30 +845,72 @@ class InMemoryRAG:
                     else:
                         match = False
                         break
-                
+
                 if match:
-                    filtered_items.append(item)
-        
-        if not filtered_items:
+                    indices.append(row)
+
+            if not indices:
+                return []
+
+        if indices is not None:
+            matrix = self._kb.matrix[indices]
+            scales = self._kb.scales[indices] if self._kb.scales is not None else None
+        else:
+            matrix = self._kb.matrix
+            scales = self._kb.scales
+
+        # Rows are L2-normalized at insert; normalizing the query once
+        # makes similarity a single dot product per row (one BLAS GEMV)
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
             return []
-        
-        # Calculate similarities
-        embeddings = [item['embedding'] for item in filtered_items]
-        similarities = cosine_similarity([query_embedding], embeddings)[0]
-        
-        # Create results with similarity scores
+        q = q / q_norm
+
+        if scales is not None:
+            # int8 mode: quantize the query symmetrically like the rows
+            q_scale = max(float(np.max(np.abs(q))) / 127.0, 1e-12)
+            if simsimd is not None:
+                # Cosine is scale-invariant, so the per-row and query
+                # scales cancel and the int8 codes can be compared
+                # directly - VNNI/dot-product instructions where available
+                q_int8 = np.round(q / q_scale).astype(np.int8)
+                similarities = 1.0 - np.asarray(
+                    simsimd.cdist(q_int8.reshape(1, -1), matrix, metric="cosine"),
+                    dtype=np.float32
+                ).ravel()
+            else:
+                # Integer dot products with int32 accumulation, rescaled
+                # back to the float dot product of the normalized vectors
+                q_int = np.round(q / q_scale).astype(np.int32)
+                similarities = (matrix.astype(np.int32) @ q_int) * (scales * q_scale)
+        elif simsimd is not None and matrix.dtype == np.float32:
+            # One SIMD pass over the matrix; cosine distance -> similarity
+            similarities = 1.0 - np.asarray(
+                simsimd.cdist(q.reshape(1, -1), matrix, metric="cosine"),
+                dtype=np.float32
+            ).ravel()
+        else:
+            # float16 matrices promote to float32 inside the matmul
+            similarities = matrix @ q
+
+        # Partial top-k selection, then order the survivors
+        limit = min(limit, similarities.shape[0])
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        top = top[np.argsort(-similarities[top])]
+
         results = []
-        for item, similarity in zip(filtered_items, similarities):
+        for pos in top:
+            row = indices[pos] if indices is not None else int(pos)
+            item = self.knowledge_base[row]
             results.append({
                 'content': item['content'],
                 'metadata': item['metadata'],
-                'relevance': float(similarity),
+                'relevance': float(similarities[pos]),
                 'id': item['id']
             })
-        
-        # Sort by similarity and return top results
-        results.sort(key=lambda x: x['relevance'], reverse=True)
-        return results[:limit]
+
+        return results
     
     def save_context(self, user_input: str, response: str, metadata: Dict = None):
         """Save conversation context to memory"""
@@ -245,7 +918,7 @@ class InMemoryRAG:
             return
         
         context_entry = {
-            'id': str(uuid.uuid4()),
+            'id': _new_id(),
             'user_input': user_input,
             'response': response,
             'timestamp': datetime.now().isoformat(),
@@ -267,38 +940,45 @@ class InMemoryRAG:
             context_entry['content'] = context_content
             context_entry['embedding'] = embedding
             
-            # Add to context base
+            # Add to context base, the per-session row index and the
+            # contiguous embedding matrix
             self.context_base.append(context_entry)
-            
-            # Save to disk
-            self.save_persisted_data()
+            self._ctx_by_session.setdefault(
+                self.current_session_id, []).append(len(self.context_base) - 1)
+            self._append_ctx_row(embedding)
+
+            # One appended log line per turn; the full snapshot rewrite
+            # happens at compaction, flush or exit
+            self._append_context_wal(context_entry)
+            self._dirty = True
         except Exception as e:
             print(f"⚠️  Error saving context embedding: {e}")
     
-    def get_relevant_context(self, query: str, limit: int = 3) -> List[Dict]:
+    def get_relevant_context(self, query: str, limit: int = 3,
+                             query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Retrieve relevant conversation context"""
         if not self.context_base:
             return []
-        
-        # Filter by current session
-        session_contexts = [ctx for ctx in self.context_base 
-                          if ctx.get("session_id") == self.current_session_id]
-        
-        if not session_contexts:
+
+        # Filter by current session - one index lookup, not a scan of
+        # every session's history
+        rows = self._ctx_by_session.get(self.current_session_id)
+        if not rows or self._ctx_matrix is None:
             return []
-        
-        # Get query embedding
-        query_embedding = self.get_embeddings([query])[0]
-        
-        # Calculate similarities
-        embeddings = [ctx['embedding'] for ctx in session_contexts if 'embedding' in ctx]
-        valid_contexts = [ctx for ctx in session_contexts if 'embedding' in ctx]
-        
-        if not embeddings:
+
+        # Get query embedding unless the caller already has it
+        if query_embedding is None:
+            query_embedding = self.get_embeddings([query])[0]
+
+        # Gather the session's rows from the contiguous matrix; rows are
+        # normalized at insert, so similarity is one dot product
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
             return []
-        
-        similarities = cosine_similarity([query_embedding], embeddings)[0]
-        
+        similarities = self._ctx_matrix[rows] @ (q / q_norm)
+        valid_contexts = [self.context_base[i] for i in rows]
+
         # Create results
         results = []
         for ctx, similarity in zip(valid_contexts, similarities):
@@ -315,21 +995,13 @@ class InMemoryRAG:
     
     def _format_numbered_lists(self, text: str) -> str:
         """Format numbered lists to have proper line breaks between items"""
-        # Pattern to match numbered lists (1. 2. 3. etc.)
-        pattern = r'(\d+\.\s+[^1-9]*?)(?=\d+\.|$)'
-        
-        def replace_list(match):
-            item = match.group(1).strip()
-            return item + '\n'
-        
-        formatted_text = re.sub(pattern, replace_list, text)
-        
+        # Numbered lists (1. 2. 3. etc.)
+        formatted_text = _NUM_LIST_RE.sub(_replace_list_item, text)
+
         # Handle patterns like "1) text 2) text 3) text"
-        pattern2 = r'(\d+\)\s+[^1-9]*?)(?=\d+\)|$)'
-        formatted_text = re.sub(pattern2, replace_list, formatted_text)
-        
-        formatted_text = formatted_text.rstrip('\n')
-        return formatted_text
+        formatted_text = _NUM_PAREN_RE.sub(_replace_list_item, formatted_text)
+
+        return formatted_text.rstrip('\n')
     
 
     def generate_agentic_response(self, user_input: str, session_id: str = None, mode: str = None, category=None) -> str:
@@ -349,44 +1021,70 @@ class InMemoryRAG:
 
     def handle_initial_selection(self, user_input: str) -> str:
         """Handle when user hasn't selected a mode yet"""
-        user_lower = user_input.lower()
-        
-        if any(word in user_lower for word in ['consultation', 'assess', 'test', 'level', 'recommend']):
+        tokens = set(_WORD_RE.findall(user_input.lower()))
+
+        if tokens & _CONSULT_KWS:
             return "I'll help you with a consultation! Please click the 'Consultation' button above to get started with our interactive assessment."
-        elif any(word in user_lower for word in ['question', 'faq', 'info', 'about', 'price', 'teacher']):
+        elif tokens & _FAQ_KWS:
             return "I'd be happy to answer your questions! Please click the 'FAQ' button above and select which topic you'd like to know about."
         else:
             return "I can help you with either:\n\n**Consultation** - Get personalized course recommendations through an interactive assessment\n\n**FAQ** - Answer questions about our programs, pricing, teachers, etc.\n\nPlease select one of the options above to get started!"
 
-    """Generate context-aware response with agentic behavior"""
-    def generate_agentic_response_faq(self, user_input: str, category=None) -> str:
-        
+    """Gather context/knowledge for a FAQ turn and build both prompts.
+    Shared by the blocking and streaming response paths."""
+    def _prepare_faq_turn(self, user_input: str, category=None):
         # Update selected attributes if provided
         if category is not None:
             self.selected_category = category
 
         print(f"🔍 Processing: {user_input}")
         print(f"📋 Context - Category: {self.selected_category}")
-        
+
+        # Embed the user input once and share it between the context and
+        # knowledge lookups
+        query_embedding = self.get_embeddings([user_input])[0]
+
         # Get relevant context from conversation
-        context_history = self.get_relevant_context(user_input, limit=3)
-        
+        context_history = self.get_relevant_context(user_input, limit=3,
+                                                    query_embedding=query_embedding)
+
         # Build filters for knowledge search
         filters = {}
         if self.selected_category:
             filters['category'] = self.selected_category
-        
+
         # Search knowledge base
-        knowledge_items = self.search_knowledge_base(user_input, limit=5, filters=filters if filters else None)
-        
+        knowledge_items = self.search_knowledge_base(user_input, limit=5,
+                                                     filters=filters if filters else None,
+                                                     query_embedding=query_embedding)
+
         print(f'📚 Found {len(knowledge_items)} knowledge items')
         print(f'💬 Found {len(context_history)} context items')
-        
-         
-        # Build prompt with context
+
         system_prompt = self._build_system_prompt(None)  # changed from context_history to None
         user_prompt = self._build_user_prompt(user_input, context_history, knowledge_items)
-        
+        return system_prompt, user_prompt, knowledge_items, context_history
+
+    """Format the finished response and record the exchange"""
+    def _finish_faq_turn(self, user_input: str, assistant_response: str,
+                         knowledge_items: List[Dict], context_history: List[Dict]) -> str:
+        # Format the response to improve numbered list formatting
+        formatted_response = self._format_numbered_lists(assistant_response)
+
+        # Save this interaction to context
+        self.save_context(user_input, formatted_response, {
+            "knowledge_items_used": len(knowledge_items),
+            "context_items_used": len(context_history),
+            "selected_category": self.selected_category,
+        })
+
+        return formatted_response
+
+    """Generate context-aware response with agentic behavior"""
+    def generate_agentic_response_faq(self, user_input: str, category=None) -> str:
+        system_prompt, user_prompt, knowledge_items, context_history = \
+            self._prepare_faq_turn(user_input, category)
+
         # Generate response
         response = self.openai_client.chat.completions.create(
             model="gpt-4",
@@ -397,24 +1095,61 @@ class InMemoryRAG:
             max_tokens=800,
             temperature=0.3
         )
-        
+
         assistant_response = response.choices[0].message.content
-        
-        # Format the response to improve numbered list formatting
-        formatted_response = self._format_numbered_lists(assistant_response)
-        
-        # Save this interaction to context
-        self.save_context(user_input, formatted_response, {
-            "knowledge_items_used": len(knowledge_items),
-            "context_items_used": len(context_history),
-            "selected_category": self.selected_category,
-        })
-        
-        return formatted_response
+
+        return self._finish_faq_turn(user_input, assistant_response,
+                                     knowledge_items, context_history)
+
+    """Stream a FAQ response token by token.
+
+    Yields text deltas as they arrive so callers can flush them to the
+    client immediately - time-to-first-token instead of full-completion
+    latency. List formatting and context saving run on the accumulated
+    buffer once the stream ends."""
+    def stream_agentic_response_faq(self, user_input: str, category=None):
+        system_prompt, user_prompt, knowledge_items, context_history = \
+            self._prepare_faq_turn(user_input, category)
+
+        response = self.openai_client.chat.completions.create(
+            model="gpt-4",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            max_tokens=800,
+            temperature=0.3,
+            stream=True
+        )
+
+        buffer = []
+        for chunk in response:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                buffer.append(token)
+                yield token
+
+        self._finish_faq_turn(user_input, ''.join(buffer),
+                              knowledge_items, context_history)
     
     """Build system prompt based on current context"""
     def _build_system_prompt(self, procedure_context: Optional[Dict]=None) -> str:
-        
+        # No consultation context: the prebuilt prompt, zero allocations
+        if not (procedure_context and isinstance(procedure_context, dict)):
+            return self._base_system_prompt
+
+        return self._base_system_prompt + f"""
+            ACTIVE CONSULTATION CONTEXT:
+            - Currently working on: {', '.join(procedure_context.get('active_procedures', []))}
+            - Current step type: {procedure_context.get('current_step_type', 'unknown')}
+            - Follow the user flow systematically
+            - Ask context questions before proceeding with steps
+            - Guide the user through each question ro concern
+        """
+
+    """Render the static part of the system prompt (done once at init)"""
+    def _render_base_system_prompt(self) -> str:
+
         '''
         # Build product context
         product_context = ""
@@ -488,19 +1223,7 @@ class InMemoryRAG:
         """
         
         # Add context
-        base_prompt += categories_context
-        
-        if procedure_context and isinstance(procedure_context, dict):
-            base_prompt += f"""
-                ACTIVE CONSULTATION CONTEXT:
-                - Currently working on: {', '.join(procedure_context.get('active_procedures', []))}
-                - Current step type: {procedure_context.get('current_step_type', 'unknown')}
-                - Follow the user flow systematically
-                - Ask context questions before proceeding with steps
-                - Guide the user through each question ro concern
-            """
-                
-        return base_prompt
+        return base_prompt + categories_context
     
     """Build user prompt with relevant context and knowledge"""
     def _build_user_prompt(self, user_input: str, context_history: List[Dict], knowledge_items: List[Dict]) -> str:
@@ -543,6 +1266,13 @@ class InMemoryRAG:
     """Clear all knowledge base items"""
     def clear_knowledge_base(self):
         self.knowledge_base = []
+        self._kb.clear()
+        self._faiss_index = None
+        self._rows_by_category.clear()
+        self._invalidate_metadata_caches()
+        self._insert_generation += 1
+        self._content_hashes = set()
+        self._pending_rows = []
         self.save_persisted_data()
         print("✅ Knowledge base cleared")
     
@@ -550,5 +1280,9 @@ class InMemoryRAG:
     def clear_context(self):
         self.context_base = []
         self.conversation_history = []
+        self._ctx_by_session = {}
+        self._ctx_buf = None
+        self._ctx_matrix = None
+        self._ctx_rows = 0
         self.save_persisted_data()
         print("✅ Context cleared")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Fused filtered top-k similarity kernels for the in-memory RAG search path.
+
+When numba is installed the scan is JIT-compiled with parallel loops so the
+category filter and the dot product run in one fused pass (no intermediate
+mask or gathered matrix copy). Without numba a NumPy fallback is used.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+
+if HAVE_NUMBA:
+    @njit(cache=True, parallel=True, fastmath=True)
+    def _filtered_cosine_scores(vecs, norms, cats, q, q_norm, cat_id):
+        n = vecs.shape[0]
+        scores = np.full(n, -1e30, dtype=np.float32)
+        for i in prange(n):
+            if cats[i] == cat_id:
+                s = 0.0
+                for d in range(q.shape[0]):
+                    s += vecs[i, d] * q[d]
+                scores[i] = s / (norms[i] * q_norm + 1e-12)
+        return scores
+else:
+    def _filtered_cosine_scores(vecs, norms, cats, q, q_norm, cat_id):
+        scores = np.full(vecs.shape[0], -1e30, dtype=np.float32)
+        mask = cats == cat_id
+        if mask.any():
+            scores[mask] = (vecs[mask] @ q) / (norms[mask] * q_norm + 1e-12)
+        return scores
+
+
+"""Top-k rows matching cat_id, ranked by cosine similarity.
+
+Returns (indices, similarities) sorted best-first; rows not matching the
+category are never returned.
+"""
+def topk_filtered(vecs, norms, cats, q, q_norm, cat_id, k):
+    scores = _filtered_cosine_scores(vecs, norms, cats, q, np.float32(q_norm), cat_id)
+
+    k = min(k, scores.shape[0])
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+
+    # Drop sentinel rows (category mismatch)
+    top = top[scores[top] > -1e29]
+    return top, scores[top]
@@ -12,16 +12,18 @@ from file_tracker import get_processed_files, mark_file_processed, clear_process
 def process_existing_uploads(
     uploads_path: str = "uploads",
     custom_categories: Optional[Dict[str, str]] = None,
-    verbose: bool = True
+    verbose: bool = True,
+    rag_system=None
 ) -> Dict[str, int]:
     """
     Process existing files in uploads folder and add them to knowledge base.
-    
+
     Args:
         uploads_path: Path to uploads folder
         custom_categories: Custom category mapping
         verbose: Whether to print progress messages
-    
+        rag_system: Existing RAG instance to ingest into (default: shared one)
+
     Returns:
         Dictionary with processing statistics
     """
@@ -46,7 +48,8 @@ def process_existing_uploads(
     stats = process_uploads_folder(
         uploads_path=uploads_path,
         custom_categories=default_categories,
-        dry_run=False
+        dry_run=False,
+        rag_system=rag_system
     )
     
     if verbose:
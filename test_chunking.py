@@ -5,7 +5,10 @@ Simple test script to verify chunking functions work without requiring the full
 
 import os
 import sys
-from chunking import extract_chunks_from_file
+import tempfile
+import unittest
+
+from chunking import extract_chunks_from_file, iter_chunks_from_file
 
 def test_file_processing():
     """Test processing files in uploads folder"""
@@ -54,5 +57,47 @@ def test_file_processing():
             else:
                 print(f"  ⏭️  Skipping unsupported file: {filename}")
 
+class SmallPdfExtractionTest(unittest.TestCase):
+    """Regression: small PDFs once reached fitz as mmap objects, which
+    PyMuPDF rejects (TypeError: bad stream) - uploads raised 500s and
+    sub-16-page PDFs silently produced zero chunks. Extract from a real
+    generated PDF so that path can't break unnoticed again."""
+
+    @classmethod
+    def setUpClass(cls):
+        import fitz  # PyMuPDF
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.pdf_path = os.path.join(cls.tmpdir.name, "small.pdf")
+        doc = fitz.open()
+        page = doc.new_page()
+        page.insert_text(
+            (72, 72),
+            "Hello consultation agent.\n\nA small PDF for the regression test.")
+        doc.save(cls.pdf_path)
+        doc.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_extract_chunks_from_small_pdf(self):
+        chunks = extract_chunks_from_file(
+            self.pdf_path, "small.pdf", category="Testing")
+        self.assertTrue(chunks, "small PDF produced no chunks")
+        text, metadata = chunks[0]
+        self.assertIn("Hello consultation agent", text)
+        self.assertEqual(metadata["category"], "Testing")
+        self.assertEqual(metadata["file_type"], "pdf")
+        self.assertEqual(metadata["page"], 1)
+
+    def test_iter_chunks_from_small_pdf(self):
+        chunks = list(iter_chunks_from_file(
+            self.pdf_path, "small.pdf", category="Testing"))
+        self.assertTrue(chunks, "small PDF streamed no chunks")
+        self.assertIn("Hello consultation agent", chunks[0][0])
+
+
 if __name__ == "__main__":
     test_file_processing()
+    unittest.main()
@@ -1,25 +1,144 @@
 from typing import List, Tuple, Dict
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import gzip
+import json
 import os
+import shutil
+import subprocess
+import sys
+import threading
+import weakref
 
-"""Store embeddings with metadata in the in-memory RAG system"""
-def store_embeddings_with_metadata(rag_system, chunk_tuples: List[Tuple[str, Dict]]):
+import numpy as np
+
+from rag_inmemory import _content_hash, _json_dumps, _json_loads
+
+# Metadata keys whose values repeat across nearly every chunk of a file
+_INTERN_KEYS = ('category', 'type', 'source')
+
+# Memoized filter results: one LRU per live RAG instance mapping
+# (insert generation, frozen filters) -> matched row numbers. UI filter
+# chips repeat the same combinations; the generation in the key retires
+# stale entries on insert/clear without ever scanning the cache. Keyed
+# weakly on the instance itself - id() values get recycled, so a fresh
+# instance at a dead one's address must not see its rows - and the
+# whole LRU is collected with the instance.
+_FILTER_CACHE_MAX = 128
+_filter_cache: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_filter_cache_lock = threading.Lock()
+
+"""Intern the high-repetition metadata string values in place, so each
+unique value is stored once and equality checks start as pointer
+compares (both in the filter paths and the stats counters)"""
+def _intern_metadata_values(chunk_tuples: List[Tuple[str, Dict]]):
+    for _, metadata in chunk_tuples:
+        for key in _INTERN_KEYS:
+            value = metadata.get(key)
+            if type(value) is str:
+                metadata[key] = sys.intern(value)
+
+"""Skip chunks whose exact text is already stored (re-uploads,
+overlapping documents, files re-extracted after a partially failed
+batch): hashing runs at memory speed while each missed duplicate would
+cost an embedding call and a matrix row"""
+def _drop_duplicate_chunks(rag_system, valid_chunks: List[Tuple[str, Dict]]):
+    stored = rag_system._content_hashes
+    batch_seen = set()
+    fresh_chunks = []
+    for text, metadata in valid_chunks:
+        digest = _content_hash(text)
+        if digest in stored or digest in batch_seen:
+            continue
+        batch_seen.add(digest)
+        fresh_chunks.append((text, metadata))
+    return fresh_chunks
+
+"""Store embeddings with metadata in the in-memory RAG system.
+
+Chunks go in batch_size at a time, so peak memory is bounded by the
+slice being embedded rather than the whole ingest."""
+def store_embeddings_with_metadata(rag_system, chunk_tuples: List[Tuple[str, Dict]],
+                                   batch_size: int = 128):
     if not chunk_tuples:
         print("⚠️ Warning: No chunks provided to store")
         return
-    
-    # Filter out empty chunks
-    valid_chunks = [(text, metadata) for text, metadata in chunk_tuples 
-                   if text and text.strip()]
-    
+
+    # Filter out empty chunks. isspace() is a C scan with no allocation,
+    # unlike strip() which builds a trimmed copy just to boolean-test it
+    valid_chunks = [(text, metadata) for text, metadata in chunk_tuples
+                    if text and not text.isspace()]
+
     if not valid_chunks:
         print("⚠️ Warning: No valid chunks found after filtering")
         return
-    
+
+    fresh_chunks = _drop_duplicate_chunks(rag_system, valid_chunks)
+    duplicates = len(valid_chunks) - len(fresh_chunks)
+    if duplicates:
+        print(f"ℹ️ Skipping {duplicates} duplicate chunks")
+    if not fresh_chunks:
+        print("✅ All chunks already stored - nothing to do")
+        return []
+    valid_chunks = fresh_chunks
+    _intern_metadata_values(valid_chunks)
+
     print(f"Storing {len(valid_chunks)} chunks with embeddings...")
-    
-    # Use batch method for efficiency
-    doc_ids = rag_system.add_knowledge_batch(valid_chunks)
-    
+
+    doc_ids = []
+    if len(valid_chunks) > batch_size:
+        # Keep two batches in flight: while one batch's rows are being
+        # inserted under the knowledge-base lock, the next batch's
+        # embedding round trip is already on the wire
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            in_flight = deque()
+            for start in range(0, len(valid_chunks), batch_size):
+                in_flight.append(pool.submit(
+                    rag_system.add_knowledge_batch,
+                    valid_chunks[start:start + batch_size]))
+                if len(in_flight) > 2:
+                    doc_ids.extend(in_flight.popleft().result())
+            while in_flight:
+                doc_ids.extend(in_flight.popleft().result())
+    else:
+        doc_ids = rag_system.add_knowledge_batch(valid_chunks)
+    rag_system.flush_if_dirty()
+
+    print(f"✅ Successfully stored {len(doc_ids)} chunks in knowledge base")
+    return doc_ids
+
+"""Store chunks from many files in fixed-size embedding batches.
+
+One call per batch_size chunks instead of one per file, so the OpenAI
+round trips are amortized across the whole ingest run regardless of how
+the chunks are spread over files."""
+def store_embeddings_batched(rag_system, chunk_tuples: List[Tuple[str, Dict]], batch_size: int = 512):
+    valid_chunks = [(text, metadata) for text, metadata in chunk_tuples
+                    if text and not text.isspace()]
+    if not valid_chunks:
+        print("⚠️ Warning: No valid chunks found after filtering")
+        return []
+
+    # Dedup here too: when a later sub-batch fails mid-run, the earlier
+    # sub-batches' rows are already inserted and persisted, and the next
+    # run re-extracts the same files - those chunks must not land twice
+    fresh_chunks = _drop_duplicate_chunks(rag_system, valid_chunks)
+    duplicates = len(valid_chunks) - len(fresh_chunks)
+    if duplicates:
+        print(f"ℹ️ Skipping {duplicates} duplicate chunks")
+    if not fresh_chunks:
+        print("✅ All chunks already stored - nothing to do")
+        return []
+    valid_chunks = fresh_chunks
+    _intern_metadata_values(valid_chunks)
+
+    print(f"Storing {len(valid_chunks)} chunks in batches of {batch_size}...")
+
+    doc_ids = []
+    for start in range(0, len(valid_chunks), batch_size):
+        doc_ids.extend(rag_system.add_knowledge_batch(valid_chunks[start:start + batch_size]))
+
     print(f"✅ Successfully stored {len(doc_ids)} chunks in knowledge base")
     return doc_ids
 
@@ -36,113 +155,378 @@ def get_knowledge_stats(rag_system):
         print("📊 Knowledge base is empty")
         return
     
-    # Count by category
-    categories = {}
-    types = {}
-    
-    for item in rag_system.knowledge_base:
-        metadata = item.get('metadata', {})
-        
-        category = metadata.get('category', 'Unknown')
-        doc_type = metadata.get('type', 'Unknown')
-        
-        categories[category] = categories.get(category, 0) + 1
-        types[doc_type] = types.get(doc_type, 0) + 1
-    
+    # Tallies are maintained at insert time - no rescan of the items
+    categories = rag_system._category_counts
+    types = rag_system._type_counts
+
     print(f"📊 Knowledge Base Statistics:")
     print(f"  Total items: {total_items}")
-    print(f"  Categories: {len(categories)} - {dict(list(categories.items())[:5])}")
-    print(f"  Types: {len(types)} - {dict(list(types.items())[:5])}")
+    print(f"  Categories: {len(categories)} - {dict(categories.most_common(5))}")
+    print(f"  Types: {len(types)} - {dict(types.most_common(5))}")
+
+"""Mirror src into dst, copying files concurrently.
+
+shutil.copytree copies one file at a time; fanning the copies across a
+small thread pool keeps several requests queued at the disk, which
+modern SSDs need before they reach full bandwidth. Each worker uses
+shutil.copy2, so the kernel's zero-copy fast path still applies."""
+def _copytree_parallel(src: str, dst: str, max_workers: int = None):
+    if max_workers is None:
+        max_workers = min(16, (os.cpu_count() or 4) * 2)
+
+    files = []
+
+    def collect(src_dir, dst_dir):
+        os.makedirs(dst_dir, exist_ok=True)
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                target = os.path.join(dst_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    collect(entry.path, target)
+                else:
+                    files.append((entry.path, target))
+
+    collect(src, dst)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Consume the iterator so worker exceptions propagate
+        for _ in pool.map(lambda pair: shutil.copy2(*pair), files):
+            pass
+
+"""To create a backup of the knowledge base.
 
-"""To create a backup of the knowledge base"""
+Tries a copy-on-write reflink clone first (btrfs/xfs/APFS): instant and
+O(metadata) instead of re-reading and re-writing every byte of the
+persist directory. Hardlinks are deliberately not used - the save path
+rewrites files in place, which would write through a shared inode
+straight into the backup. Falls back to a plain byte copy elsewhere."""
 def backup_knowledge_base(rag_system, backup_path: str = "./backup"):
-    import shutil
-    import datetime
-    
     os.makedirs(backup_path, exist_ok=True)
-    
+
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_dir = os.path.join(backup_path, f"rag_backup_{timestamp}")
-    
+
     try:
-        # Copy the entire persist directory
-        shutil.copytree(rag_system.persist_directory, backup_dir)
-        print(f"✅ Backup created at: {backup_dir}")
+        try:
+            result = subprocess.run(
+                ['cp', '-a', '--reflink=always',
+                 rag_system.persist_directory, backup_dir],
+                capture_output=True)
+            if result.returncode == 0:
+                print(f"✅ Backup created at: {backup_dir} (reflink clone)")
+                return backup_dir
+        except OSError:
+            pass
+
+        # Filesystem (or platform) can't clone - copy the bytes, in parallel
+        shutil.rmtree(backup_dir, ignore_errors=True)
+        _copytree_parallel(rag_system.persist_directory, backup_dir)
+        print(f"✅ Backup created at: {backup_dir} (full copy)")
         return backup_dir
-    except Exception as e:
+    except (OSError, shutil.Error) as e:
         print(f"❌ Backup failed: {e}")
         return None
 
-"""Restore knowledge base from a backup"""
+"""Logical backup: stream the knowledge base as gzip-compressed NDJSON.
+
+Unlike the directory snapshot this writes only what the data actually
+is - one {id, content, metadata, embedding, timestamp} record per line,
+compressed on the fly - so the file carries none of the persist
+directory's on-disk amplification and peak memory stays at one record.
+Embeddings are included when the float32 matrix holds them verbatim;
+quantized stores restore by re-embedding (the SQLite embedding cache
+makes that a local read for unchanged text)."""
+def backup_knowledge_base_logical(rag_system, output_path: str):
+    matrix = rag_system._kb.matrix if rag_system.embedding_dtype == "float32" else None
+    try:
+        with gzip.open(output_path, 'wb', compresslevel=1) as f:
+            for row, item in enumerate(rag_system.knowledge_base):
+                record = {
+                    'id': item['id'],
+                    'content': item['content'],
+                    'metadata': item['metadata'],
+                    'timestamp': item.get('timestamp', 'Unknown'),
+                }
+                if matrix is not None:
+                    record['embedding'] = matrix[row]
+                f.write(_json_dumps(record) + b'\n')
+
+        print(f"✅ Logical backup written to: {output_path}")
+        print(f"📊 Backed up {len(rag_system.knowledge_base)} items")
+        return output_path
+    except (OSError, TypeError, ValueError) as e:
+        print(f"❌ Logical backup failed: {e}")
+        return None
+
+"""Re-insert the records of a logical backup in batches"""
+def restore_knowledge_base_logical(rag_system, backup_file: str, batch_size: int = 512):
+    if not os.path.exists(backup_file):
+        print(f"❌ Backup file does not exist: {backup_file}")
+        return False
+
+    try:
+        restored = 0
+        batch = []
+        with gzip.open(backup_file, 'rb') as f:
+            for line in f:
+                record = _json_loads(line)
+                batch.append((record['content'], record.get('metadata') or {}))
+                if len(batch) >= batch_size:
+                    restored += len(rag_system.add_knowledge_batch(batch))
+                    batch = []
+        if batch:
+            restored += len(rag_system.add_knowledge_batch(batch))
+        rag_system.flush_if_dirty()
+
+        print(f"✅ Restored {restored} items from: {backup_file}")
+        return True
+    except (OSError, KeyError, ValueError) as e:
+        print(f"❌ Logical restore failed: {e}")
+        return False
+
+"""Restore knowledge base from a backup.
+
+The backup is copied to a sibling temp directory first and swapped in
+with renames, so the live directory is never half-deleted: a failed
+copy leaves the current data untouched, and the displaced directory is
+only discarded after the swap succeeded."""
 def restore_knowledge_base(rag_system, backup_path: str):
-    import shutil
-    
     if not os.path.exists(backup_path):
         print(f"❌ Backup path does not exist: {backup_path}")
         return False
-    
+
+    persist_dir = rag_system.persist_directory
+    tmp_dir = persist_dir + '.restoring'
+    old_dir = persist_dir + '.old'
+
     try:
-        # Remove current data
-        if os.path.exists(rag_system.persist_directory):
-            shutil.rmtree(rag_system.persist_directory)
-        
-        # Restore from backup
-        shutil.copytree(backup_path, rag_system.persist_directory)
-        
-        # Reload the data
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.copytree(backup_path, tmp_dir)
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        displaced = os.path.exists(persist_dir)
+        if displaced:
+            os.rename(persist_dir, old_dir)
+        try:
+            os.rename(tmp_dir, persist_dir)
+        except OSError:
+            if displaced:
+                os.rename(old_dir, persist_dir)  # roll back the swap
+            raise
+
+        # The context log handle still points into the displaced
+        # directory; close it so appends reopen the restored file
+        if rag_system._ctx_wal_fh is not None:
+            rag_system._ctx_wal_fh.close()
+            rag_system._ctx_wal_fh = None
+
+        # Reload the data; the old directory is deleted off-thread so
+        # the caller isn't stuck waiting on rmtree I/O
         rag_system.load_persisted_data()
-        
+        if displaced:
+            threading.Thread(
+                target=shutil.rmtree, args=(old_dir,),
+                kwargs={'ignore_errors': True}, daemon=True).start()
+
         print(f"✅ Knowledge base restored from: {backup_path}")
         return True
-    except Exception as e:
+    except (OSError, shutil.Error) as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
         print(f"❌ Restore failed: {e}")
         return False
 
-"""Search knowledge base by metadata only (no semantic search)"""
-def search_knowledge_by_metadata(rag_system, **metadata_filters) -> List[Dict]:
-    results = []
-    
-    for item in rag_system.knowledge_base:
-        metadata = item.get('metadata', {})
-        match = True
-        
-        for key, value in metadata_filters.items():
-            if key not in metadata or metadata[key] != value:
-                match = False
-                break
-        
-        if match:
-            results.append({
+class _ResultView:
+    """One metadata-search result: fixed __slots__ storage instead of a
+    fresh 4-key dict per matched item, roughly halving the allocation
+    cost on large result sets. Supports dict-style reads ([], get,
+    keys), so dict(view) still materializes a plain dict on demand."""
+    __slots__ = ('id', 'content', 'metadata', 'timestamp')
+
+    def __init__(self, item: Dict):
+        self.id = item['id']
+        self.content = item['content']
+        self.metadata = item.get('metadata', {})
+        self.timestamp = item.get('timestamp', 'Unknown')
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self):
+        return f"_ResultView(id={self.id!r}, content={self.content[:40]!r}...)"
+
+"""Search knowledge base by metadata only (no semantic search).
+
+Each filter is an inverted-index lookup (key -> value -> row numbers),
+and posting lists are intersected smallest-first, so the cost scales
+with the result size instead of the knowledge-base size. Filters on
+values the index can't hash fall back to a vectorized column compare."""
+def search_knowledge_by_metadata(rag_system, **metadata_filters) -> List["_ResultView"]:
+    knowledge_base = rag_system.knowledge_base
+    if not knowledge_base:
+        return []
+
+    # No filters: skip the index machinery and row bookkeeping entirely
+    if not metadata_filters:
+        return [_ResultView(item) for item in knowledge_base]
+
+    try:
+        cache_key = (rag_system._insert_generation,
+                     frozenset(metadata_filters.items()))
+    except TypeError:
+        cache_key = None  # unhashable filter value - uncacheable
+    if cache_key is not None:
+        with _filter_cache_lock:
+            per_rag = _filter_cache.get(rag_system)
+            cached_rows = per_rag.get(cache_key) if per_rag is not None else None
+            if cached_rows is not None:
+                per_rag.move_to_end(cache_key)
+        if cached_rows is not None:
+            return [_ResultView(knowledge_base[int(row)]) for row in cached_rows]
+
+    postings = []
+    fallback_keys = []
+    for key, value in metadata_filters.items():
+        # Interned at ingest, so intern the probe too: equality against
+        # stored values then short-circuits on pointer identity
+        if type(value) is str:
+            value = sys.intern(value)
+        try:
+            plist = rag_system._meta_index.get(key, {}).get(value)
+        except TypeError:
+            # Unhashable filter value - resolve via the columnar scan
+            fallback_keys.append((key, value))
+            continue
+        if not plist:
+            return []
+        postings.append(plist)
+
+    candidates = None
+    if postings:
+        # int32 copies of the postings; intersection then runs as a C
+        # merge instead of Python-level set hashing. Postings are
+        # appended in row order, so they are already sorted and unique.
+        # (Copies, not frombuffer views - an exported buffer would make
+        # a concurrent insert's append to the posting list fail.)
+        arrays = sorted((np.array(p, dtype=np.int32) for p in postings),
+                        key=len)
+        candidates = arrays[0]
+        for rows in arrays[1:]:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if candidates.size == 0:
+                return []
+
+    if fallback_keys:
+        columns = rag_system._metadata_columns()
+        masks = []
+        for key, value in fallback_keys:
+            column = columns.get(key)
+            if column is None:
+                return []
+            masks.append(column == value)
+        matched = np.where(np.logical_and.reduce(masks))[0]
+        if candidates is None:
+            candidates = matched
+        else:
+            candidates = np.intersect1d(candidates, matched, assume_unique=True)
+
+    if cache_key is not None:
+        with _filter_cache_lock:
+            per_rag = _filter_cache.get(rag_system)
+            if per_rag is None:
+                per_rag = _filter_cache[rag_system] = OrderedDict()
+            per_rag[cache_key] = candidates
+            per_rag.move_to_end(cache_key)
+            while len(per_rag) > _FILTER_CACHE_MAX:
+                per_rag.popitem(last=False)
+
+    return [_ResultView(knowledge_base[int(row)]) for row in candidates]
+
+"""Export knowledge base to JSON file (embeddings excluded for size).
+
+Records are encoded one at a time with the same orjson-or-stdlib helper
+the persistence layer uses and streamed straight to disk, so the export
+never holds a second full-size copy of the knowledge base in memory.
+Metadata dicts shared across chunks (the common case: every chunk of a
+file carries the same category/type dict) are encoded once and the
+bytes spliced into each record. Pass indent=True for a pretty-printed
+(buffered, slower) file."""
+def export_knowledge_to_json(rag_system, output_path: str, indent: bool = False):
+    def export_records():
+        for item in rag_system.knowledge_base:
+            yield {
                 'id': item['id'],
                 'content': item['content'],
-                'metadata': metadata,
+                'metadata': item['metadata'],
                 'timestamp': item.get('timestamp', 'Unknown')
-            })
-    
-    return results
+            }
 
-"""Export knowledge base to JSON file"""
-def export_knowledge_to_json(rag_system, output_path: str):
-    import json
-    
-    # Prepare data for JSON export (exclude embeddings for size)
-    export_data = []
-    for item in rag_system.knowledge_base:
-        export_item = {
-            'id': item['id'],
-            'content': item['content'],
-            'metadata': item['metadata'],
-            'timestamp': item.get('timestamp', 'Unknown')
-        }
-        export_data.append(export_item)
-    
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, indent=2, ensure_ascii=False)
-        
+        if indent:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(list(export_records()), f, indent=2, ensure_ascii=False)
+        else:
+            # Items referencing the same metadata dict reuse its encoding
+            meta_cache: Dict[int, bytes] = {}
+            with open(output_path, 'wb') as f:
+                f.write(b'[')
+                for i, item in enumerate(rag_system.knowledge_base):
+                    metadata = item['metadata']
+                    meta_blob = meta_cache.get(id(metadata))
+                    if meta_blob is None:
+                        meta_blob = _json_dumps(metadata)
+                        meta_cache[id(metadata)] = meta_blob
+                    if i:
+                        f.write(b',\n')
+                    f.write(b'{"id":' + _json_dumps(item['id'])
+                            + b',"content":' + _json_dumps(item['content'])
+                            + b',"metadata":' + meta_blob
+                            + b',"timestamp":'
+                            + _json_dumps(item.get('timestamp', 'Unknown')) + b'}')
+                f.write(b']')
+
+        print(f"✅ Knowledge base exported to: {output_path}")
+        print(f"📊 Exported {len(rag_system.knowledge_base)} items")
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        print(f"❌ Export failed: {e}")
+        return False
+
+"""Export knowledge base to a Parquet file (embeddings excluded).
+
+Columnar layout plus zstd compression makes the file several times
+smaller than the JSON export and far faster for downstream pipelines
+to reload. pyarrow is optional - without it this reports the miss and
+leaves export_knowledge_to_json as the portable path."""
+def export_knowledge_to_parquet(rag_system, output_path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("⚠️ pyarrow not installed - use export_knowledge_to_json instead")
+        return False
+
+    knowledge_base = rag_system.knowledge_base
+    try:
+        # Build the columns directly - no per-row record dicts
+        table = pa.Table.from_arrays([
+            pa.array([item['id'] for item in knowledge_base]),
+            pa.array([item['content'] for item in knowledge_base]),
+            pa.array([item['metadata'] for item in knowledge_base]),
+            pa.array([item.get('timestamp', 'Unknown') for item in knowledge_base]),
+        ], names=['id', 'content', 'metadata', 'timestamp'])
+        pq.write_table(table, output_path, compression='zstd', compression_level=3)
+
         print(f"✅ Knowledge base exported to: {output_path}")
-        print(f"📊 Exported {len(export_data)} items")
+        print(f"📊 Exported {len(knowledge_base)} items")
         return True
-    except Exception as e:
+    except (OSError, TypeError, ValueError, pa.ArrowException) as e:
         print(f"❌ Export failed: {e}")
         return False
\ No newline at end of file